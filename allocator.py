@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+from datetime import datetime
+
+from snapshot_store import as_text
+
+
+class EsimAllocator:
+    """Cola precalculada de eSIMs disponibles por (producto, IP).
+
+    Se construye una vez por versión de datos y se comparte entre sesiones.
+    Tomar la siguiente eSIM es un popleft bajo un lock (O(1)); el reclamo en
+    Supabase es un UPDATE condicionado a estado = 'Disponible', así que si otro
+    operador u otro proceso ganó la misma eSIM simplemente no regresa en la
+    respuesta y se toma la siguiente de la cola.
+    """
+
+    def __init__(self, df, version):
+        self.version = version
+        self._queues = {}
+        self._lock = threading.Lock()
+        if df.empty:
+            return
+        disponibles = df[df['estado'].eq('Disponible').fillna(False).to_numpy(dtype=bool)]
+        keys = zip(as_text(disponibles['producto']), as_text(disponibles['ip']), disponibles['id'].tolist())
+        # Las más antiguas primero
+        for producto, ip, esim_id in sorted(keys, key=lambda k: k[2]):
+            self._queues.setdefault((producto, ip), deque()).append(esim_id)
+
+    def _matching(self, producto=None, ip=None):
+        return [key for key in self._queues
+                if (producto is None or key[0] == producto) and (ip is None or key[1] == ip)]
+
+    def available(self, producto=None, ip=None):
+        """eSIMs que quedan en cola para el producto/IP (None = cualquiera)"""
+        with self._lock:
+            return sum(len(self._queues[key]) for key in self._matching(producto, ip))
+
+    def _take(self, n, producto, ip):
+        taken = []
+        with self._lock:
+            for key in self._matching(producto, ip):
+                queue = self._queues[key]
+                while queue and len(taken) < n:
+                    taken.append(queue.popleft())
+                if len(taken) == n:
+                    break
+        return taken
+
+    def claim(self, client, asignado_a, n=1, producto=None, ip=None, table_name='esim_data'):
+        """Asigna hasta n eSIMs disponibles a asignado_a y regresa los registros reclamados.
+
+        Cada ronda manda un solo UPDATE ... WHERE id IN (...) AND estado =
+        'Disponible'; las que ya no estaban disponibles se reemplazan con las
+        siguientes de la cola hasta completar n o vaciarla.
+        """
+        claimed = []
+        while len(claimed) < n:
+            ids = self._take(n - len(claimed), producto, ip)
+            if not ids:
+                break
+            now = datetime.now().isoformat()
+            response = (
+                client.table(table_name)
+                .update({
+                    'asignado_a': asignado_a,
+                    'estado': 'Usado',
+                    'fecha_asignacion': now,
+                    'fecha_ultimo_cambio': now,
+                })
+                .in_('id', ids)
+                .eq('estado', 'Disponible')
+                .execute()
+            )
+            claimed.extend(response.data or [])
+        return claimed
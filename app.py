@@ -1,15 +1,24 @@
 import streamlit as st
 import pandas as pd
-from supabase import create_client, Client
+from supabase import acreate_client
 import os
 from dotenv import load_dotenv
 import plotly.express as px
 from datetime import datetime
-import io
-from io import BytesIO
-import requests
 import time
-from template_generator import generate_template, validate_import_data
+from template_generator import EXCEL_MIME, template_bytes, write_report, validate_import_data
+from data_layer import DataLayer
+from snapshot_store import sync_snapshot, fetch_by_ids
+from import_engine import read_import_file, existing_keys, split_duplicates, import_dataframe, fetch_inventory
+from filter_engine import FilterIndex
+from batch_lookup import KeyIndex, parse_codes, read_codes_file
+from backup_manager import create_backup, restore_snapshot, compact_backups, load_manifest, archive_backups
+from rollups import AssignmentRollups
+from allocator import EsimAllocator
+from qr_service import QR_BASE_URL, QR_AUDIT_SWEEP, QR_ZIP_MAX, fetch_qr, build_qr_zip, run_qr_audit, load_qr_audit, missing_qr_iccids
+from session_manager import open_details, open_detail, close_detail, is_detail_open, evict_offscreen, session_memory
+from inventory_explorer import build_payload, inventory_explorer
+from profiling import ADMIN_KEY, PROFILE_THRESHOLD_SECONDS, start_rerun_profile, finish_rerun_profile, saved_profiles, read_saved_profile
 
 # Cargar variables de entorno
 load_dotenv()
@@ -22,9 +31,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# URL base del repositorio de QR
-QR_BASE_URL = "https://raw.githubusercontent.com/Kratoslar69/esim-qr-baitel/main/"
-
 # Control de auto-refresco (cambiar a 0 para desactivar)
 AUTO_REFRESH_MINUTES = 3
 
@@ -33,6 +39,7 @@ if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = False
 
 # Inicializar vista por defecto
+VIEW_MODES = ["Tarjetas", "Lista", "Explorador"]
 if 'view_mode' not in st.session_state:
     st.session_state.view_mode = "Tarjetas"
 
@@ -40,6 +47,36 @@ if 'view_mode' not in st.session_state:
 if 'last_refresh' not in st.session_state:
     st.session_state.last_refresh = datetime.now()
 
+# Perfilado de la ejecución: cProfile si el admin lo activó, muestreo si hay umbral
+rerun_profile = start_rerun_profile(enabled=st.session_state.get('perfilar_ejecuciones', False))
+
+# Estado de la ejecución para el perfil: el script lo va llenando conforme calcula
+# datos y filtros, así que un st.rerun() temprano solo reporta lo que ya existía
+profile_context = {}
+
+def profile_state():
+    """Estado de la sesión para el perfil (filtros, búsqueda, vista, conteos)"""
+    return {
+        **profile_context,
+        'vista': st.session_state.view_mode,
+        'memoria_sesion_kb': round(session_memory(st.session_state)[0] / 1024, 1),
+    }
+
+def finish_profile():
+    """Cierra el perfil de la ejecución (al final del script o antes de st.rerun())"""
+    # profile_state (memoria de la sesión incluida) solo se calcula si hay reporte
+    report = finish_rerun_profile(rerun_profile, profile_state, forced=st.session_state.get('perfilar_ejecuciones', False))
+    if report:
+        st.session_state.ultimo_perfil = report
+
+def rerun():
+    """st.rerun() sin perder el perfil de las ejecuciones lentas que terminan así"""
+    finish_profile()
+    st.rerun()
+
+# Panel de diagnóstico solo con ?admin=<ADMIN_KEY>
+is_admin = bool(ADMIN_KEY) and st.query_params.get("admin") == ADMIN_KEY
+
 # Colores BAITEL
 BAITEL_YELLOW = "#FFD100"
 BAITEL_BLUE = "#0089D0"
@@ -247,35 +284,72 @@ def init_supabase():
         st.stop()
     
     try:
-        client = create_client(url, key)
-        return client
+        # Cliente asíncrono con fachada síncrona: mismas llamadas .table(...).execute()
+        return DataLayer(lambda: acreate_client(url, key))
     except Exception as e:
         st.error(f"❌ Error conectando a Supabase: {str(e)}")
         st.stop()
 
 supabase = init_supabase()
 
-# Función para verificar si existe QR
-def check_qr_exists(iccid):
-    try:
-        url = f"{QR_BASE_URL}{iccid}.png"
-        response = requests.head(url, timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+# Columnas que usan las vistas de lista/tarjetas, filtros y estadísticas.
+# PIN y PUK solo se piden al abrir el detalle de una eSIM.
+LIST_COLUMNS = "id, iccid, msisdn, producto, imsi, serie, ip, estado, asignado_a, distribuidor, fecha_creacion, fecha_asignacion, fecha_ultimo_cambio"
 
 # Función para cargar datos
-@st.cache_data(ttl=10)
-def load_data():
+# cache_resource: todas las sesiones del proceso comparten el mismo DataFrame,
+# respaldado por el snapshot Arrow mapeado en disco (no se copia por sesión)
+@st.cache_resource(ttl=10)
+def load_data(force_full=False):
+    """Regresa (DataFrame, versión de datos); solo descarga el delta desde Supabase"""
     try:
-        response = supabase.table('esim_data').select('*').order('id', desc=True).execute()
-        if response.data:
-            df = pd.DataFrame(response.data)
-            return df
-        return pd.DataFrame()
+        return sync_snapshot(supabase, force_full=force_full, columns=LIST_COLUMNS)
     except Exception as e:
         st.error(f"Error cargando datos: {str(e)}")
-        return pd.DataFrame()
+        return pd.DataFrame(), 0
+
+# Índice de filtros, uno por versión de datos (compartido entre sesiones)
+@st.cache_resource(max_entries=2)
+def get_filter_index(_df, version):
+    return FilterIndex(_df, version)
+
+# Índice ICCID/MSISDN para búsqueda por lote, uno por versión de datos
+@st.cache_resource(max_entries=2)
+def get_key_index(_df, version):
+    return KeyIndex(_df, version)
+
+# Inventario en Arrow comprimido para el explorador del navegador, uno por versión de datos
+@st.cache_resource(max_entries=2)
+def get_explorer_payload(_df, version):
+    return build_payload(_df)
+
+# Agregados diarios de asignaciones, actualizados de forma incremental por versión de datos
+@st.cache_resource
+def get_rollups():
+    return AssignmentRollups()
+
+# Colas de eSIMs disponibles por producto/IP, una por versión de datos
+@st.cache_resource(max_entries=2)
+def get_allocator(_df, version):
+    return EsimAllocator(_df, version)
+
+# Registro completo de una eSIM (PIN/PUK/IMSI/fechas), solo al abrir su detalle
+@st.cache_data(ttl=60, max_entries=64, show_spinner=False)
+def load_esim_detail(esim_id):
+    try:
+        response = supabase.table('esim_data').select('*').eq('id', esim_id).execute()
+        return response.data[0] if response.data else {}
+    except Exception:
+        return {}
+
+# Limpiar caché de datos tras una escritura
+def refresh_data():
+    st.cache_data.clear()
+    load_data.clear()
+
+# Convertir filas a dicts con None en lugar de pd.NA para mostrarlas
+def display_records(frame):
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
 
 # Función para actualizar un registro
 def update_record(record_id, updates):
@@ -316,8 +390,12 @@ def import_from_file(file):
         return False, f"❌ Error importando: {str(e)}"
 
 # Función para actualizar eSIM en Supabase
-def update_esim(esim_id, asignado_a, estado):
-    """Actualiza asignación de eSIM con fecha automática"""
+def update_esim(esim_id, asignado_a, estado, estado_esperado=None):
+    """Actualiza asignación de eSIM con fecha automática.
+    
+    Con estado_esperado la escritura es condicional: solo se aplica si la eSIM
+    sigue en ese estado (evita que dos operadores asignen la misma eSIM).
+    """
     try:
         update_data = {
             'asignado_a': asignado_a,
@@ -330,15 +408,20 @@ def update_esim(esim_id, asignado_a, estado):
             update_data['fecha_asignacion'] = datetime.now().isoformat()
             update_data['estado'] = 'Usado'  # Forzar a Usado al asignar
         
-        response = supabase.table('esim_data').update(update_data).eq('id', esim_id).execute()
+        query = supabase.table('esim_data').update(update_data).eq('id', esim_id)
+        if estado_esperado:
+            query = query.eq('estado', estado_esperado)
+        response = query.execute()
+        if estado_esperado and not response.data:
+            return False, "⚠️ Esta eSIM ya fue asignada por otro operador. Actualiza los datos."
         return True, "✅ eSIM actualizada exitosamente"
     except Exception as e:
         return False, f"❌ Error al actualizar: {str(e)}"
 
 # Función para mostrar QR con modal interactivo
 def show_qr_modal(row):
+    row = {**row, **load_esim_detail(row['id'])}
     iccid = row['iccid']
-    qr_url = f"{QR_BASE_URL}{iccid}.png"
     
     # Contenedor con fondo semi-transparente
     st.markdown("""
@@ -352,14 +435,11 @@ def show_qr_modal(row):
     # Imagen QR centrada
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
-        try:
-            response = requests.get(qr_url)
-            if response.status_code == 200:
-                st.image(qr_url, width=400)  # QR grande y claro
-            else:
-                st.warning(f"⚠️ No se encontró la imagen QR para {iccid}")
-        except:
-            st.error(f"❌ Error al cargar QR desde {qr_url}")
+        qr_image = fetch_qr(iccid)  # Usa la caché local de QR si ya se descargó
+        if qr_image:
+            st.image(qr_image, width=400)  # QR grande y claro
+        else:
+            st.warning(f"⚠️ No se encontró la imagen QR para {iccid}")
     
     # Información detallada
     st.markdown(f"<h3 style='text-align: center; margin-top: 20px; color: {TEXT_COLOR};'>Información Detallada</h3>", unsafe_allow_html=True)
@@ -427,12 +507,14 @@ def show_qr_modal(row):
                 submit = True
         
         if submit:
-            success, message = update_esim(row['id'], nuevo_asignado, nuevo_estado)
+            # Si la eSIM estaba disponible, solo asignarla si nadie la tomó mientras tanto
+            estado_esperado = 'Disponible' if current_estado == 'Disponible' and nuevo_asignado.strip() else None
+            success, message = update_esim(row['id'], nuevo_asignado, nuevo_estado, estado_esperado)
             if success:
                 st.success(message)
-                st.cache_data.clear()
+                refresh_data()
                 time.sleep(1)
-                st.rerun()
+                rerun()
             else:
                 st.error(message)
 
@@ -453,10 +535,12 @@ with col_toggle_mode:
     mode_icon = "🌙" if st.session_state.dark_mode else "☀️"
     if st.button(f"{mode_icon} Modo {'Claro' if st.session_state.dark_mode else 'Oscuro'}", use_container_width=True):
         st.session_state.dark_mode = not st.session_state.dark_mode
-        st.rerun()
+        rerun()
 
 # Cargar datos
-df = load_data()
+df, data_version = load_data()
+filter_index = get_filter_index(df, data_version)
+profile_context.update(version_datos=data_version, filas_totales=len(df))
 
 # ============================================
 # CONTROL DE AUTO-REFRESCO
@@ -466,9 +550,9 @@ if AUTO_REFRESH_MINUTES > 0:
     time_diff = (current_time - st.session_state.last_refresh).total_seconds() / 60
     
     if time_diff >= AUTO_REFRESH_MINUTES:
-        st.cache_data.clear()
+        refresh_data()
         st.session_state.last_refresh = current_time
-        st.rerun()
+        rerun()
 
 
 # Sidebar
@@ -488,9 +572,10 @@ with st.sidebar:
             st.caption("🔄 Refrescando...")
     
     if st.button("🔄 Actualizar Datos Ahora", use_container_width=True):
-        st.cache_data.clear()
+        refresh_data()
+        load_data(force_full=True)
         st.session_state.last_refresh = datetime.now()
-        st.rerun()
+        rerun()
     
     st.divider()
     
@@ -508,43 +593,87 @@ with st.sidebar:
     
     filter_ip = st.multiselect(
         "IP",
-        options=df['ip'].unique().tolist() if not df.empty else []
+        options=filter_index.options('ip')
     )
     
     search_query = st.text_input("🔎 Buscar", placeholder="ICCID, MSISDN, Asignado a...")
     
+    filter_sin_qr = st.checkbox("🚫 Solo sin QR (según auditoría)")
+    profile_context.update(estado=filter_estado, producto=filter_producto, ip=filter_ip,
+                           busqueda=search_query, solo_sin_qr=filter_sin_qr)
+    
     st.divider()
     
     st.subheader("📁 Importar/Exportar")
     
-    # Descargar plantilla
-    if st.button("📝 Descargar Plantilla Excel", use_container_width=True):
-        template = generate_template()
-        st.download_button(
-            label="⬇️ Descargar Plantilla",
-            data=template,
-            file_name=f"plantilla_esim_{datetime.now().strftime('%Y%m%d')}.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            use_container_width=True,
-            help="Descarga esta plantilla, llénala con tus datos y súbela de nuevo"
-        )
+    # Descargar plantilla (se genera una sola vez por proceso)
+    st.download_button(
+        label="📝 Descargar Plantilla Excel",
+        data=template_bytes(),
+        file_name=f"plantilla_esim_{datetime.now().strftime('%Y%m%d')}.xlsx",
+        mime=EXCEL_MIME,
+        use_container_width=True,
+        help="Descarga esta plantilla, llénala con tus datos y súbela de nuevo"
+    )
     
     # Exportar datos actuales
     if st.button("📊 Exportar Inventario Actual", use_container_width=True):
         if not df.empty:
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='eSIM Data')
-            output.seek(0)
+            # La exportación lleva todas las columnas, se leen completas de Supabase
+            export_df = fetch_inventory(supabase)
             
             st.download_button(
                 label="⬇️ Descargar Excel",
-                data=output,
+                data=write_report({'eSIM Data': export_df}),
                 file_name=f"esim_inventario_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                mime=EXCEL_MIME,
                 use_container_width=True
             )
     
+    # Respaldo incremental: base completa la primera vez, después solo cambios
+    if st.button("💾 Crear Respaldo Incremental", use_container_width=True):
+        if not df.empty:
+            try:
+                entry = create_backup(supabase)
+                st.success(
+                    f"✅ Respaldo {entry['tipo']}: {entry['filas']} registros, "
+                    f"{entry['eliminados']} eliminados ({entry['bytes'] / 1024:.1f} KB)"
+                )
+            except Exception as e:
+                st.error(f"❌ Error al crear respaldo: {str(e)}")
+    
+    respaldos = load_manifest()['respaldos']
+    if respaldos:
+        with st.expander(f"🕒 Restaurar respaldo ({len(respaldos)} disponibles)"):
+            punto = st.selectbox(
+                "Punto de restauración",
+                [e['fecha'] for e in reversed(respaldos)],
+                format_func=lambda f: f.replace('T', ' ')[:19]
+            )
+            if st.button("♻️ Reconstruir Inventario", use_container_width=True):
+                restored = restore_snapshot(until=punto)
+                st.download_button(
+                    label=f"⬇️ Descargar ({len(restored)} registros)",
+                    data=write_report({'eSIM Data': restored}),
+                    file_name=f"esim_respaldo_{punto[:19].replace(':', '').replace('-', '')}.xlsx",
+                    mime=EXCEL_MIME,
+                    use_container_width=True
+                )
+            # El disco del servidor puede borrarse al redesplegar: descarga los archivos para conservarlos
+            if st.button("📦 Preparar Archivos de Respaldo", use_container_width=True):
+                with archive_backups() as archive:
+                    archive_bytes = archive.read()
+                st.download_button(
+                    label=f"⬇️ Descargar ZIP ({len(archive_bytes) / 1024:.1f} KB)",
+                    data=archive_bytes,
+                    file_name=f"esim_respaldos_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    mime="application/zip",
+                    use_container_width=True
+                )
+            if len(respaldos) > 1 and st.button("🗜️ Compactar Respaldos", use_container_width=True):
+                compact_backups()
+                st.success("✅ Respaldos compactados en una nueva base")
+    
     st.divider()
     
     # Importar datos masivos
@@ -558,10 +687,7 @@ with st.sidebar:
     if uploaded_file:
         try:
             # Leer archivo
-            if uploaded_file.name.endswith('.csv'):
-                import_df = pd.read_csv(uploaded_file)
-            else:
-                import_df = pd.read_excel(uploaded_file)
+            import_df = read_import_file(uploaded_file)
             
             # Validar datos
             is_valid, validation_msg = validate_import_data(import_df)
@@ -580,38 +706,21 @@ with st.sidebar:
                 if st.button("✅ Confirmar e Importar", use_container_width=True, type="primary"):
                     with st.spinner("Verificando duplicados..."):
                         try:
-                            # Obtener ICCIDs y MSISDNs existentes en la base de datos
-                            existing_response = supabase.table('esim_data').select('iccid, msisdn').execute()
-                            existing_iccids = set([row['iccid'] for row in existing_response.data if row.get('iccid')])
-                            existing_msisdns = set([row['msisdn'] for row in existing_response.data if row.get('msisdn')])
-                            
-                            # Identificar duplicados por ICCID o MSISDN
-                            duplicate_mask = (
-                                import_df['iccid'].isin(existing_iccids) | 
-                                import_df['msisdn'].isin(existing_msisdns)
-                            )
-                            
-                            # Filtrar solo los registros nuevos (que no existen)
-                            new_records_df = import_df[~duplicate_mask]
-                            duplicates_df = import_df[duplicate_mask]
+                            # Separar registros que ya existen por ICCID o MSISDN
+                            existing_iccids, existing_msisdns = existing_keys(supabase)
+                            new_records_df, duplicates_df = split_duplicates(import_df, existing_iccids, existing_msisdns)
                             duplicates_count = len(duplicates_df)
                             
                             if duplicates_count > 0:
                                 st.warning(f"⚠️ Se encontraron {duplicates_count} registros duplicados que serán omitidos")
                                 st.info("Los duplicados se detectaron por ICCID o MSISDN existente en la base de datos")
                                 
-                                # Crear archivo Excel en memoria
-                                output = BytesIO()
-                                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                                    duplicates_df.to_excel(writer, index=False, sheet_name='Duplicados')
-                                output.seek(0)
-                                
                                 # Botón de descarga
                                 st.download_button(
                                     label="📄 Descargar Reporte de Duplicados",
-                                    data=output,
+                                    data=write_report({'Duplicados': duplicates_df}),
                                     file_name=f"duplicados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                    mime=EXCEL_MIME,
                                     use_container_width=True
                                 )
                             
@@ -620,49 +729,14 @@ with st.sidebar:
                             else:
                                 st.info(f"📤 Importando {len(new_records_df)} registros nuevos...")
                                 
-                                total_imported = 0
-                                failed_records = []
                                 progress_bar = st.progress(0)
                                 
-                                # Procesar registro por registro para evitar fallos masivos
-                                for idx, row in enumerate(new_records_df.itertuples(index=False)):
-                                    try:
-                                        # Convertir a dict
-                                        record = row._asdict()
-                                        
-                                        # Limpiar valores NaN/None
-                                        for key, value in record.items():
-                                            if pd.isna(value) or value == 'nan' or value == 'NaN':
-                                                record[key] = None
-                                        
-                                        # Agregar timestamps
-                                        if 'fecha_creacion' not in record or record['fecha_creacion'] is None:
-                                            record['fecha_creacion'] = datetime.now().isoformat()
-                                        if 'fecha_ultimo_cambio' not in record or record['fecha_ultimo_cambio'] is None:
-                                            record['fecha_ultimo_cambio'] = datetime.now().isoformat()
-                                        
-                                        # Intentar insertar
-                                        supabase.table('esim_data').insert([record]).execute()
-                                        total_imported += 1
-                                        
-                                    except Exception as insert_error:
-                                        # Si falla, agregar a la lista de fallidos
-                                        error_msg = str(insert_error)
-                                        if 'duplicate' in error_msg.lower() or 'unique constraint' in error_msg.lower():
-                                            failed_records.append({
-                                                'iccid': record.get('iccid', 'N/A'),
-                                                'msisdn': record.get('msisdn', 'N/A'),
-                                                'motivo': 'Duplicado (ICCID o MSISDN ya existe)'
-                                            })
-                                        else:
-                                            failed_records.append({
-                                                'iccid': record.get('iccid', 'N/A'),
-                                                'msisdn': record.get('msisdn', 'N/A'),
-                                                'motivo': f'Error: {error_msg[:100]}'
-                                            })
-                                    
-                                    # Actualizar barra de progreso
-                                    progress_bar.progress((idx + 1) / len(new_records_df))
+                                # Inserción por bloques; si un bloque falla se reintenta registro por registro
+                                total_imported, failed_records = import_dataframe(
+                                    supabase,
+                                    new_records_df,
+                                    progress=lambda done, total: progress_bar.progress(done / total)
+                                )
                                 
                                 progress_bar.empty()
                                 
@@ -677,45 +751,79 @@ with st.sidebar:
                                     st.warning(f"⚠️ {len(failed_records)} registros fallaron durante la importación")
                                     
                                     # Generar reporte de fallos
-                                    failed_df = pd.DataFrame(failed_records)
-                                    output_failed = BytesIO()
-                                    with pd.ExcelWriter(output_failed, engine='openpyxl') as writer:
-                                        failed_df.to_excel(writer, index=False, sheet_name='Fallos')
-                                    output_failed.seek(0)
-                                    
                                     st.download_button(
                                         label="📄 Descargar Reporte de Fallos",
-                                        data=output_failed,
+                                        data=write_report({'Fallos': pd.DataFrame(failed_records)}),
                                         file_name=f"fallos_importacion_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                                        mime=EXCEL_MIME,
                                         use_container_width=True
                                     )
-                            st.cache_data.clear()
+                            refresh_data()
                             time.sleep(2)
-                            st.rerun()
+                            rerun()
                         except Exception as e:
                             st.error(f"❌ Error al importar: {str(e)}")
         
         except Exception as e:
             st.error(f"❌ Error al leer archivo: {str(e)}")
 
+    # Diagnóstico de rendimiento (solo administradores)
+    if is_admin:
+        st.divider()
+        with st.expander("🛠️ Diagnóstico"):
+            st.toggle(
+                "⏱️ Perfilar cada ejecución",
+                key='perfilar_ejecuciones',
+                help="Usa cProfile en cada ejecución de esta sesión (agrega overhead)"
+            )
+            if PROFILE_THRESHOLD_SECONDS > 0:
+                st.caption(f"Las ejecuciones de más de {PROFILE_THRESHOLD_SECONDS:g} s se capturan automáticamente")
+
+            session_bytes, session_keys = session_memory(st.session_state)
+            st.caption(f"🧠 Memoria de la sesión: ~{session_bytes / 1024:.1f} KB en {len(session_keys)} claves")
+            if session_keys:
+                st.caption(" · ".join(f"{key}: {size / 1024:.1f} KB" for key, size in session_keys[:5]))
+
+            last_profile = st.session_state.get('ultimo_perfil')
+            if last_profile:
+                st.caption(f"Última captura: {last_profile['duracion_s']} s ({last_profile['profiler']})")
+                st.download_button(
+                    label="⬇️ Descargar último perfil",
+                    data=last_profile['texto'],
+                    file_name=last_profile['nombre'],
+                    mime="text/plain",
+                    use_container_width=True
+                )
+
+            saved = saved_profiles()
+            if saved:
+                selected_profile = st.selectbox("Capturas guardadas", saved)
+                st.download_button(
+                    label="⬇️ Descargar captura",
+                    data=read_saved_profile(selected_profile),
+                    file_name=selected_profile,
+                    mime="text/plain",
+                    use_container_width=True
+                )
+
 # VERSION: 2.3.0 - Manejo robusto de duplicados con inserción individual
-# Aplicar filtros
-filtered_df = df.copy()
+# Aplicar filtros (bitmaps precalculados + LRU por combinación de filtros)
+filtered_positions = filter_index.positions({
+    'estado': [filter_estado] if filter_estado != "Todos" else [],
+    'producto': [filter_producto] if filter_producto != "Todos" else [],
+    'ip': filter_ip,
+}, search_query) if not df.empty else None
+# Sin filtros se usa el DataFrame compartido en lugar de una copia por sesión
+filtered_df = df if filtered_positions is None or len(filtered_positions) == len(df) else df.take(filtered_positions)
 
+if filter_sin_qr and not filtered_df.empty:
+    filtered_df = filtered_df[filtered_df['iccid'].isin(missing_qr_iccids()).fillna(False).to_numpy(dtype=bool)]
+profile_context['filas_filtradas'] = len(filtered_df)
+
+# Cerrar detalles de eSIMs que ya no están en pantalla
+# (el explorador filtra en el navegador, así que ahí cuenta todo el inventario)
 if not filtered_df.empty:
-    if filter_estado != "Todos":
-        filtered_df = filtered_df[filtered_df['estado'] == filter_estado]
-    
-    if filter_producto != "Todos":
-        filtered_df = filtered_df[filtered_df['producto'] == filter_producto]
-    
-    if filter_ip:
-        filtered_df = filtered_df[filtered_df['ip'].isin(filter_ip)]
-    
-    if search_query:
-        mask = filtered_df.astype(str).apply(lambda x: x.str.contains(search_query, case=False, na=False)).any(axis=1)
-        filtered_df = filtered_df[mask]
+    evict_offscreen(st.session_state, df['id'] if st.session_state.view_mode == "Explorador" else filtered_df['id'])
 
 # Estadísticas principales
 col1, col2, col3, col4 = st.columns(4)
@@ -724,11 +832,11 @@ with col1:
     st.metric("📊 Total eSIM", len(df))
 
 with col2:
-    disponibles = len(df[df['estado'] == 'Disponible']) if not df.empty else 0
+    disponibles = filter_index.count('estado', 'Disponible')
     st.metric("✅ Disponibles", disponibles)
 
 with col3:
-    usadas = len(df[df['estado'] == 'Usado']) if not df.empty else 0
+    usadas = filter_index.count('estado', 'Usado')
     st.metric("🔴 Usadas", usadas)
 
 with col4:
@@ -737,7 +845,7 @@ with col4:
 st.divider()
 
 # Tabs principales
-tab1, tab2, tab3, tab4 = st.tabs(["📋 Tabla de Datos", "📊 Estadísticas", "➕ Agregar Nuevo", "📖 Instrucciones"])
+tab1, tab_entrega, tab2, tab3, tab4 = st.tabs(["📋 Tabla de Datos", "⚡ Entrega Rápida", "📊 Estadísticas", "➕ Agregar Nuevo", "📖 Instrucciones"])
 
 with tab1:
     # Toggle para vista
@@ -747,22 +855,188 @@ with tab1:
     with col_toggle:
         view_mode = st.selectbox(
             "👁️ Vista",
-            ["Tarjetas", "Lista"],
-            index=0 if st.session_state.view_mode == "Tarjetas" else 1,
+            VIEW_MODES,
+            index=VIEW_MODES.index(st.session_state.view_mode),
             label_visibility="collapsed"
         )
         st.session_state.view_mode = view_mode
     
-    if not filtered_df.empty:
+    # Búsqueda por lote para lectores de código de barras y listas pegadas
+    with st.expander("📦 Búsqueda por lote (escáner / lista de ICCID o MSISDN)"):
+        with st.form("batch_lookup_form"):
+            codes_text = st.text_area(
+                "Escanea o pega los códigos (uno por línea)",
+                height=150,
+                placeholder="8952140063883316310F\n2219592007\n..."
+            )
+            codes_file = st.file_uploader("O sube un archivo (.txt, .csv, .xlsx)", type=['txt', 'csv', 'xlsx'])
+            lookup_submitted = st.form_submit_button("🔎 Buscar lote", use_container_width=True)
+        
+        if lookup_submitted:
+            codes = parse_codes(codes_text)
+            if codes_file:
+                codes += read_codes_file(codes_file)
+            
+            if not codes:
+                st.warning("⚠️ No se capturó ningún código")
+            else:
+                lookup_start = time.perf_counter()
+                found_df, missing_codes = get_key_index(df, data_version).lookup(codes)
+                lookup_ms = (time.perf_counter() - lookup_start) * 1000
+                
+                col_found, col_missing, col_time = st.columns(3)
+                col_found.metric("✅ Encontrados", len(found_df))
+                col_missing.metric("❌ No encontrados", len(missing_codes))
+                col_time.metric("⏱️ Tiempo", f"{lookup_ms:.1f} ms")
+                
+                if not found_df.empty:
+                    st.dataframe(found_df, use_container_width=True, hide_index=True)
+                if missing_codes:
+                    st.warning(f"⚠️ Códigos sin registro: {', '.join(missing_codes[:20])}{'...' if len(missing_codes) > 20 else ''}")
+                
+                report = pd.concat(
+                    [found_df, pd.DataFrame({'codigo': missing_codes, 'estado': 'No encontrado'})],
+                    ignore_index=True
+                )
+                st.download_button(
+                    label="⬇️ Descargar resultado (CSV)",
+                    data=report.to_csv(index=False).encode('utf-8'),
+                    file_name=f"busqueda_lote_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
+    
+    # Auditoría de cobertura de QR
+    with st.expander("🧪 Auditoría de QR (eSIMs sin imagen)"):
+        st.caption("Revisa con peticiones HEAD que cada eSIM tenga su QR en el repositorio. Solo se vuelven a revisar los resultados de más de 24 h.")
+        st.caption(f"Cada clic revisa como máximo {QR_AUDIT_SWEEP} eSIMs (primero las nunca revisadas). Para el inventario completo programa `python cli.py auditar-qr` en cron.")
+        
+        if st.button("▶️ Ejecutar Auditoría", use_container_width=True) and not df.empty:
+            audit_progress = st.progress(0)
+            checked = run_qr_audit(df['iccid'].dropna().tolist(), progress=audit_progress.progress, limit=QR_AUDIT_SWEEP)
+            audit_progress.empty()
+            st.success(f"✅ {checked} eSIMs revisadas (el resto se tomó de la caché)")
+        
+        audit_df = load_qr_audit()
+        if not audit_df.empty and not df.empty:
+            sin_qr_df = df[df['iccid'].isin(audit_df.loc[audit_df['status'] == 404, 'iccid']).fillna(False).to_numpy(dtype=bool)]
+            audited = int(df['iccid'].isin(audit_df['iccid']).sum())
+            
+            col_aud1, col_aud2, col_aud3 = st.columns(3)
+            col_aud1.metric("🔍 Revisadas", f"{audited} / {len(df)}")
+            col_aud2.metric("🚫 Sin QR", len(sin_qr_df))
+            col_aud3.metric("⚠️ Disponibles sin QR", int(sin_qr_df['estado'].eq('Disponible').fillna(False).sum()))
+            
+            if not sin_qr_df.empty:
+                report_columns = [c for c in ['iccid', 'msisdn', 'estado', 'producto', 'ip', 'asignado_a'] if c in sin_qr_df.columns]
+                sin_qr_report = sin_qr_df[report_columns].merge(audit_df[['iccid', 'checked_at']], on='iccid', how='left')
+                st.dataframe(sin_qr_report, use_container_width=True, hide_index=True)
+                st.download_button(
+                    label="⬇️ Descargar Reporte Sin QR (CSV)",
+                    data=sin_qr_report.to_csv(index=False).encode('utf-8'),
+                    file_name=f"sin_qr_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                    mime="text/csv",
+                    use_container_width=True
+                )
+    
+    # Descarga masiva de QR como ZIP
+    with st.expander("🗜️ Descargar QR en lote (ZIP)"):
+        st.caption(f"Hasta {QR_ZIP_MAX} eSIMs por ZIP desde la app. Para lotes mayores usa `python cli.py zip-qr salida.zip` en el servidor.")
+        qr_source = st.radio(
+            "Origen",
+            [f"Selección filtrada ({len(filtered_df)} eSIMs)", "Lista de ICCID"],
+            horizontal=True,
+            label_visibility="collapsed"
+        )
+        if qr_source == "Lista de ICCID":
+            qr_codes_text = st.text_area("ICCIDs (uno por línea)", height=120, key="qr_zip_codes")
+        
+        if st.button("🗜️ Generar ZIP de QR", use_container_width=True):
+            if qr_source == "Lista de ICCID":
+                qr_found_df, qr_missing_rows = get_key_index(df, data_version).lookup(parse_codes(qr_codes_text))
+                qr_selection = df[df['iccid'].isin(qr_found_df['iccid'])]
+                if qr_missing_rows:
+                    st.warning(f"⚠️ ICCIDs sin registro en el inventario: {', '.join(qr_missing_rows[:20])}")
+            else:
+                qr_selection = filtered_df
+            
+            if qr_selection.empty:
+                st.warning("⚠️ No hay eSIMs seleccionadas")
+            elif len(qr_selection) > QR_ZIP_MAX:
+                st.warning(
+                    f"⚠️ {len(qr_selection)} eSIMs superan el máximo de {QR_ZIP_MAX} por ZIP en la app. "
+                    f"Filtra la selección o genera el ZIP con `python cli.py zip-qr salida.zip`."
+                )
+            else:
+                zip_progress = st.progress(0)
+                # PIN/PUK para el manifest se piden solo para la selección
+                qr_records = sorted(fetch_by_ids(supabase, qr_selection['id'].tolist()), key=lambda r: r['id'], reverse=True)
+                zip_file, qr_missing = build_qr_zip(qr_records, progress=zip_progress.progress)
+                with zip_file:
+                    zip_bytes = zip_file.read()
+                zip_progress.empty()
+                
+                st.success(f"✅ {len(qr_selection) - len(qr_missing)} QR empaquetados")
+                if qr_missing:
+                    st.warning(f"⚠️ {len(qr_missing)} eSIMs sin QR: {', '.join(qr_missing[:20])}{'...' if len(qr_missing) > 20 else ''}")
+                st.download_button(
+                    label="⬇️ Descargar ZIP",
+                    data=zip_bytes,
+                    file_name=f"qr_esim_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                    mime="application/zip",
+                    use_container_width=True
+                )
+    
+    if view_mode == "Explorador" and not df.empty:
+        # Filtros, búsqueda, orden y paginación corren en el navegador; el
+        # servidor solo recibe la tarjeta seleccionada o la asignación
+        st.caption("🧭 El explorador tiene sus propios filtros; los de la barra lateral no aplican en esta vista.")
+        # Resultado de una asignación fallida: se muestra y se envía al navegador una sola vez
+        explorer_result = st.session_state.pop('explorador_resultado', None)
+        if explorer_result:
+            st.error(explorer_result['mensaje'])
+        explorer_action = inventory_explorer(
+            get_explorer_payload(df, data_version),
+            data_version,
+            QR_BASE_URL,
+            colors={'bg': BG_COLOR, 'bg_secondary': BG_SECONDARY, 'text': TEXT_COLOR, 'card': CARD_BG, 'accent': ACCENT_COLOR},
+            result=explorer_result,
+            key="explorador"
+        )
+        
+        # El valor del componente persiste entre ejecuciones: cada acción se procesa una sola vez
+        if explorer_action and explorer_action.get('nonce') != st.session_state.get('explorador_nonce'):
+            st.session_state.explorador_nonce = explorer_action.get('nonce')
+            if explorer_action.get('accion') == 'detalle':
+                open_detail(st.session_state, explorer_action['id'])
+            elif explorer_action.get('accion') == 'asignar':
+                success, message = update_esim(explorer_action['id'], explorer_action.get('asignado_a', ''), 'Usado', estado_esperado='Disponible')
+                if success:
+                    st.success(message)
+                    refresh_data()
+                    time.sleep(1)
+                    rerun()  # el explorador recibe la nueva versión de datos
+                else:
+                    # Sin nueva versión de datos: el acuse habilita otra vez la tarjeta
+                    st.session_state.explorador_resultado = {'nonce': explorer_action.get('nonce'), 'mensaje': message}
+                    rerun()
+        
+        # Detalles abiertos desde el explorador
+        for row in display_records(df[df['id'].isin(open_details(st.session_state)).fillna(False).to_numpy(dtype=bool)]):
+            show_qr_modal(row)
+            if st.button("❌ Cerrar", key=f"close_explorer_{row['id']}", use_container_width=True):
+                close_detail(st.session_state, row['id'])
+                rerun()
+    
+    elif not filtered_df.empty:
         if view_mode == "Lista":
             # Vista de lista (original)
-            for idx, row in filtered_df.iterrows():
+            for row in display_records(filtered_df):
                 with st.expander(f"📱 {row.get('iccid', 'N/A')} - {row.get('estado', 'N/A')} - {row.get('asignado_a', '') or 'Sin asignar'}"):
                     col_info, col_qr = st.columns([2, 1])
                     
                     with col_info:
                         st.write(f"**MSISDN:** {row.get('msisdn', 'N/A')}")
-                        st.write(f"**IMSI:** {row.get('imsi', 'N/A')}")
                         st.write(f"**Producto:** {row.get('producto', 'N/A')}")
                         st.write(f"**IP:** {row.get('ip', 'N/A')}")
                         st.write(f"**Estado:** {row.get('estado', 'N/A')}")
@@ -770,23 +1044,24 @@ with tab1:
                     
                     with col_qr:
                         if st.button(f"📱 Ver QR", key=f"qr_{row['id']}", use_container_width=True):
-                            st.session_state[f'show_qr_{row["id"]}'] = True
+                            open_detail(st.session_state, row['id'])
                     
                     # Mostrar QR si se clickeó el botón
-                    if st.session_state.get(f'show_qr_{row["id"]}', False):
+                    if is_detail_open(st.session_state, row['id']):
                         show_qr_modal(row)
                         if st.button("❌ Cerrar QR", key=f"close_qr_{row['id']}"):
-                            st.session_state[f'show_qr_{row["id"]}'] = False
-                            st.rerun()
+                            close_detail(st.session_state, row['id'])
+                            rerun()
         
         else:
             # Vista de tarjetas (nueva)
             cols_per_row = 3  # 3 tarjetas por fila en desktop
-            rows = [filtered_df.iloc[i:i+cols_per_row] for i in range(0, len(filtered_df), cols_per_row)]
+            records = display_records(filtered_df)
+            rows = [records[i:i+cols_per_row] for i in range(0, len(records), cols_per_row)]
             
             for row_data in rows:
                 cols = st.columns(cols_per_row)
-                for idx, (_, row) in enumerate(row_data.iterrows()):
+                for idx, row in enumerate(row_data):
                     with cols[idx]:
                         # Tarjeta con estilo
                         estado_color = "#27ae60" if row.get('estado') == "Disponible" else "#e74c3c"
@@ -820,19 +1095,77 @@ with tab1:
                         
                         # Botón para ver detalles
                         if st.button("🔍 Ver Detalles", key=f"card_{row['id']}", use_container_width=True):
-                            st.session_state[f'show_qr_{row["id"]}'] = True
+                            open_detail(st.session_state, row['id'])
                         
                         # Mostrar modal si se clickeó
-                        if st.session_state.get(f'show_qr_{row["id"]}', False):
+                        if is_detail_open(st.session_state, row['id']):
                             show_qr_modal(row)
                             if st.button("❌ Cerrar", key=f"close_card_{row['id']}", use_container_width=True):
-                                st.session_state[f'show_qr_{row["id"]}'] = False
-                                st.rerun()
+                                close_detail(st.session_state, row['id'])
+                                rerun()
         
         st.info(f"💡 Mostrando {len(filtered_df)} de {len(df)} registros totales")
     else:
         st.warning("⚠️ No hay datos para mostrar")
 
+with tab_entrega:
+    st.subheader("⚡ Entrega Rápida de eSIMs")
+    st.caption("Asigna automáticamente las siguientes eSIMs disponibles. Si otro operador toma la misma eSIM al mismo tiempo, se entrega la siguiente.")
+    
+    allocator = get_allocator(df, data_version)
+    
+    with st.form("quick_allocation_form"):
+        col_alloc1, col_alloc2 = st.columns(2)
+        with col_alloc1:
+            alloc_producto = st.selectbox("Producto", ["Cualquiera", "MOV", "IP"])
+            alloc_asignado = st.text_input("Asignar a *", placeholder="Ej: BT287, TIENDA, Cliente...")
+        with col_alloc2:
+            alloc_ip = st.selectbox("IP", ["Cualquiera"] + filter_index.options('ip'))
+            alloc_cantidad = st.number_input("Cantidad", min_value=1, max_value=1000, value=1, step=1)
+        alloc_submit = st.form_submit_button("⚡ Entregar", type="primary", use_container_width=True)
+    
+    alloc_producto_key = None if alloc_producto == "Cualquiera" else alloc_producto
+    alloc_ip_key = None if alloc_ip == "Cualquiera" else alloc_ip
+    st.caption(f"📦 En cola: {allocator.available(alloc_producto_key, alloc_ip_key)} eSIMs disponibles")
+    
+    if alloc_submit:
+        if not alloc_asignado.strip():
+            st.error("❌ Indica a quién se asignan las eSIMs")
+        else:
+            try:
+                claimed = allocator.claim(
+                    supabase,
+                    alloc_asignado.strip(),
+                    n=int(alloc_cantidad),
+                    producto=alloc_producto_key,
+                    ip=alloc_ip_key
+                )
+            except Exception as e:
+                claimed = []
+                st.error(f"❌ Error al asignar: {str(e)}")
+            
+            if claimed:
+                st.session_state.last_allocation = claimed
+                refresh_data()
+                if len(claimed) < alloc_cantidad:
+                    st.warning(f"⚠️ Solo había {len(claimed)} eSIMs disponibles")
+                st.success(f"✅ {len(claimed)} eSIMs asignadas a {alloc_asignado.strip()}")
+            else:
+                st.warning("⚠️ No hay eSIMs disponibles con esos criterios")
+    
+    # Última entrega de esta sesión
+    if st.session_state.get('last_allocation'):
+        entrega_df = pd.DataFrame(st.session_state.last_allocation)
+        entrega_columns = [c for c in ['iccid', 'msisdn', 'pin', 'puk', 'producto', 'ip', 'asignado_a'] if c in entrega_df.columns]
+        st.dataframe(entrega_df[entrega_columns], use_container_width=True, hide_index=True)
+        st.download_button(
+            label="⬇️ Descargar Entrega (CSV)",
+            data=entrega_df[entrega_columns].to_csv(index=False).encode('utf-8'),
+            file_name=f"entrega_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            mime="text/csv",
+            use_container_width=True
+        )
+
 with tab2:
     st.subheader("📊 Estadísticas y Gráficos")
     
@@ -870,6 +1203,48 @@ with tab2:
             color_discrete_sequence=['#9b59b6']
         )
         st.plotly_chart(fig_ip, use_container_width=True)
+        
+        # Series de tiempo a partir de los agregados diarios
+        st.subheader("📈 Tendencias de Asignación")
+        rollups = get_rollups()
+        rollups.update(df, data_version)
+        
+        col_periodo, col_grupo = st.columns(2)
+        with col_periodo:
+            periodo = st.selectbox("Periodo", ["Día", "Semana"])
+        with col_grupo:
+            agrupar_por = st.selectbox("Agrupar por", ["Distribuidor", "Asignado a"])
+        
+        grupo = 'distribuidor' if agrupar_por == "Distribuidor" else 'asignado_a'
+        asignaciones_df = rollups.assignments(freq='D' if periodo == "Día" else 'W', by=grupo)
+        
+        if not asignaciones_df.empty:
+            # Limitar a los 10 grupos con más asignaciones para que la gráfica sea legible
+            top_grupos = asignaciones_df.groupby(grupo)['asignaciones'].sum().nlargest(10).index
+            fig_asig = px.line(
+                asignaciones_df[asignaciones_df[grupo].isin(top_grupos)],
+                x='fecha',
+                y='asignaciones',
+                color=grupo,
+                markers=True,
+                title=f"Asignaciones por {periodo.lower()} ({agrupar_por})",
+                labels={'fecha': 'Fecha', 'asignaciones': 'Asignaciones', grupo: agrupar_por}
+            )
+            st.plotly_chart(fig_asig, use_container_width=True)
+        else:
+            st.info("ℹ️ Aún no hay asignaciones con fecha registrada")
+        
+        burndown_df = rollups.stock_burndown()
+        if not burndown_df.empty:
+            fig_burndown = px.line(
+                burndown_df,
+                x='fecha',
+                y='disponibles',
+                color='ip',
+                title="Stock disponible por IP (Top 10)",
+                labels={'fecha': 'Fecha', 'disponibles': 'Disponibles', 'ip': 'IP'}
+            )
+            st.plotly_chart(fig_burndown, use_container_width=True)
     else:
         st.warning("⚠️ No hay datos para generar estadísticas")
 
@@ -919,8 +1294,8 @@ with tab3:
                 success, message = add_record(new_record)
                 if success:
                     st.success(message)
-                    st.cache_data.clear()
-                    st.rerun()
+                    refresh_data()
+                    rerun()
                 else:
                     st.error(message)
 
@@ -938,14 +1313,16 @@ with tab4:
     2. **Ver Códigos QR**: Haz clic en "📱 Ver QR" para ver el código QR con toda la información
     3. **Filtrar Datos**: Usa los filtros en el panel lateral para encontrar registros específicos
     4. **Agregar Nuevos**: Ve a la pestaña "Agregar Nuevo" para crear registros
-    5. **Importar/Exportar**: Usa los botones en el panel lateral para importar o exportar datos
-    6. **Estadísticas**: Visualiza gráficos y métricas en la pestaña "Estadísticas"
+    5. **Entrega Rápida**: En la pestaña "Entrega Rápida" asigna las siguientes eSIMs disponibles (una o varias) a un distribuidor
+    6. **Importar/Exportar**: Usa los botones en el panel lateral para importar o exportar datos
+    7. **Estadísticas**: Visualiza gráficos y métricas en la pestaña "Estadísticas"
     
     #### 📱 Códigos QR:
     
     - Los códigos QR se cargan automáticamente desde GitHub
     - Cada QR muestra toda la información detallada del eSIM
     - Los QR se pueden descargar haciendo clic derecho → Guardar imagen
+    - Para descargar muchos QR a la vez usa "🗜️ Descargar QR en lote (ZIP)": incluye un manifest.csv con ICCID, MSISDN, PIN y PUK
     
     #### 🔄 Sincronización:
     
@@ -956,7 +1333,9 @@ with tab4:
     #### 💡 Consejos:
     
     - Usa la búsqueda para encontrar rápidamente registros por ICCID, MSISDN, etc.
-    - Exporta regularmente tus datos como respaldo
+    - Exporta regularmente tus datos como respaldo: los respaldos incrementales viven en el disco del servidor y se pierden al redesplegar si `BACKUP_DIR` no está en un volumen persistente
+    - Crea respaldos con "💾 Crear Respaldo Incremental": solo se guardan los cambios desde el último respaldo
+    - Desde "🕒 Restaurar respaldo" puedes reconstruir el inventario de cualquier respaldo anterior o descargar todos los archivos de respaldo con "📦 Preparar Archivos de Respaldo"
     - Los campos marcados con * son obligatorios
     
     #### 🆘 Soporte:
@@ -971,3 +1350,6 @@ st.markdown(f"""
     🚀 Sistema eSIM BAITEL | Gestión de Inventario - v2.3.0
 </div>
 """, unsafe_allow_html=True)
+
+# Cerrar el perfil con el estado de la sesión (filtros, búsqueda, vista, conteos)
+finish_profile()
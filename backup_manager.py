@@ -0,0 +1,175 @@
+import os
+import json
+import tempfile
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from snapshot_store import as_text, to_arrow_table, fetch_all, fetch_many, fetch_by_ids, overlap_watermark
+
+# Directorio local de respaldos
+BACKUP_DIR = os.getenv("BACKUP_DIR", "backups")
+
+MANIFEST_FILE = "manifest.json"
+IDS_FILE = "ids_actuales.parquet"
+
+# Marca de fila eliminada dentro de un archivo delta
+DELETED_FLAG = '_eliminado'
+
+
+def load_manifest(directory=BACKUP_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"respaldos": []}
+
+
+def _save_manifest(manifest, directory):
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+
+
+def _write_parquet(df, path):
+    pq.write_table(to_arrow_table(df), path, compression='zstd')
+    return os.path.getsize(path)
+
+
+def _plain(df):
+    """Quita pd.NA/tipos Arrow para poder combinar respaldos entre versiones"""
+    return df.astype(object).where(df.notna(), None)
+
+
+def create_backup(client, table_name='esim_data', directory=BACKUP_DIR):
+    """Crea un respaldo: base completa la primera vez, después solo el delta.
+
+    Los registros completos (incluidos PIN/PUK/IMSI) se leen directo de
+    Supabase. El delta solo descarga las filas con fecha_ultimo_cambio dentro
+    de la ventana SYNC_OVERLAP_MINUTES antes de la marca del último respaldo o
+    con id mayor al último id respaldado, más la lista de ids para marcar con
+    _eliminado los que ya no existen. Los ids nuevos que no llegaron por
+    ninguna de las dos consultas (altas confirmadas tarde) se piden aparte.
+    Regresa la entrada del manifest.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = load_manifest(directory)
+    now = datetime.now()
+    stamp = now.strftime('%Y%m%d_%H%M%S_%f')
+
+    if not manifest["respaldos"]:
+        tipo = 'base'
+        rows = _plain(pd.DataFrame(fetch_all(client, table_name)))
+        current_ids = rows['id'].tolist() if not rows.empty else []
+        deleted = 0
+        watermark = as_text(rows['fecha_ultimo_cambio']).max() if not rows.empty else ''
+    else:
+        last = manifest["respaldos"][-1]
+        since = overlap_watermark(last["watermark"])
+        changed, added, ids = fetch_many(client, table_name, [
+            ('*', lambda q: q.gte('fecha_ultimo_cambio', since)),
+            ('*', lambda q: q.gt('id', last["max_id"])),
+            ('id', None),
+        ])
+        changed += added
+        current_ids = [row['id'] for row in ids]
+        previous_ids = set(pq.read_table(os.path.join(directory, IDS_FILE)).column('id').to_pylist())
+        deleted_ids = sorted(previous_ids - set(current_ids))
+        missing = sorted(set(current_ids) - previous_ids - {row['id'] for row in changed})
+        if missing:
+            changed += fetch_by_ids(client, missing, table_name)
+
+        tipo = 'delta'
+        rows = _plain(pd.DataFrame(changed)) if changed else pd.DataFrame({'id': pd.Series(dtype='int64')})
+        rows = rows.drop_duplicates('id', keep='last')
+        rows[DELETED_FLAG] = False
+        if deleted_ids:
+            rows = pd.concat([rows, pd.DataFrame({'id': deleted_ids, DELETED_FLAG: True})], ignore_index=True)
+        deleted = len(deleted_ids)
+        watermark = last["watermark"]
+        if 'fecha_ultimo_cambio' in rows.columns:
+            watermark = max(watermark, as_text(rows['fecha_ultimo_cambio']).max())
+    max_id = max(current_ids, default=0)
+    if manifest["respaldos"]:
+        max_id = max(max_id, manifest["respaldos"][-1]["max_id"])
+
+    file_name = f"{tipo}_{stamp}.parquet"
+    size = _write_parquet(rows, os.path.join(directory, file_name))
+    _write_parquet(pd.DataFrame({'id': current_ids}), os.path.join(directory, IDS_FILE))
+
+    entry = {
+        "archivo": file_name,
+        "tipo": tipo,
+        "fecha": now.isoformat(),
+        "watermark": watermark,
+        "max_id": max_id,
+        "filas": len(rows) - deleted,
+        "eliminados": deleted,
+        "bytes": size,
+    }
+    manifest["respaldos"].append(entry)
+    _save_manifest(manifest, directory)
+    return entry
+
+
+def restore_snapshot(directory=BACKUP_DIR, until=None):
+    """Reconstruye el inventario a partir de la base y los deltas.
+
+    until es una fecha ISO: se aplican solo los respaldos creados hasta ese
+    momento. Sin until se reconstruye el estado del último respaldo.
+    """
+    entries = load_manifest(directory)["respaldos"]
+    if until:
+        entries = [e for e in entries if e["fecha"] <= until]
+    if not entries:
+        return pd.DataFrame()
+
+    state = _plain(pq.read_table(os.path.join(directory, entries[0]["archivo"])).to_pandas())
+    for entry in entries[1:]:
+        delta = _plain(pq.read_table(os.path.join(directory, entry["archivo"])).to_pandas())
+        deleted = delta[DELETED_FLAG].astype(bool) if DELETED_FLAG in delta.columns else pd.Series(False, index=delta.index)
+        state = state[~state['id'].isin(delta['id'])]
+        upserts = delta[~deleted].drop(columns=[DELETED_FLAG], errors='ignore')
+        state = pd.concat([state, upserts], ignore_index=True)
+    return state.sort_values('id', ascending=False, ignore_index=True)
+
+
+def compact_backups(directory=BACKUP_DIR):
+    """Junta base y deltas en una nueva base y borra los archivos anteriores"""
+    manifest = load_manifest(directory)
+    if len(manifest["respaldos"]) < 2:
+        return manifest["respaldos"][-1] if manifest["respaldos"] else None
+
+    last = manifest["respaldos"][-1]
+    state = restore_snapshot(directory)
+    file_name = f"base_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.parquet"
+    size = _write_parquet(state, os.path.join(directory, file_name))
+
+    entry = dict(last, archivo=file_name, tipo='base', filas=len(state), eliminados=0, bytes=size)
+    old_files = [e["archivo"] for e in manifest["respaldos"]]
+    _save_manifest({"respaldos": [entry]}, directory)
+    for name in old_files:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    return entry
+
+
+def archive_backups(directory=BACKUP_DIR):
+    """ZIP con el manifest y los archivos de respaldo, para guardarlos fuera del servidor.
+
+    Los Parquet ya van comprimidos con zstd, así que se guardan sin
+    recomprimir. Regresa un archivo temporal posicionado al inicio.
+    """
+    manifest = load_manifest(directory)
+    output = tempfile.TemporaryFile()
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf:
+        for entry in manifest["respaldos"]:
+            zf.write(os.path.join(directory, entry["archivo"]), entry["archivo"])
+        zf.writestr(MANIFEST_FILE, json.dumps(manifest, indent=2), compress_type=zipfile.ZIP_DEFLATED)
+    output.seek(0)
+    return output
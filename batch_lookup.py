@@ -0,0 +1,75 @@
+import re
+
+import pandas as pd
+
+# Columnas que se devuelven por cada código encontrado
+RESULT_COLUMNS = ['iccid', 'msisdn', 'estado', 'asignado_a', 'producto', 'ip', 'distribuidor']
+
+_CODE_SPLIT = re.compile(r'[\s,;]+')
+
+
+def normalize_code(code):
+    """Limpia un código escaneado o pegado (espacios, comillas, mayúsculas)"""
+    return str(code).strip().strip('"\'').upper()
+
+
+def parse_codes(text):
+    """Separa una lista pegada (saltos de línea, comas, punto y coma o tabuladores)"""
+    return [normalize_code(c) for c in _CODE_SPLIT.split(text or '') if normalize_code(c)]
+
+
+def read_codes_file(file):
+    """Lee códigos de un archivo subido: primera columna de un Excel/CSV o un .txt"""
+    if file.name.endswith('.xlsx'):
+        frame = pd.read_excel(file, dtype=str, header=None)
+    elif file.name.endswith('.csv'):
+        frame = pd.read_csv(file, dtype=str, header=None)
+    else:
+        return parse_codes(file.read().decode('utf-8', errors='ignore'))
+    codes = [normalize_code(c) for c in frame.iloc[:, 0].dropna()]
+    # Ignorar encabezado si lo trae
+    return [c for c in codes if c and c not in ('ICCID', 'MSISDN')]
+
+
+class KeyIndex:
+    """Índice hash ICCID/MSISDN -> posición de fila, construido una vez por versión de datos.
+
+    Cada búsqueda es un acceso a dict, así que resolver miles de códigos
+    escaneados cuesta milisegundos. Los ICCID también se indexan sin la "F" de
+    relleno final porque muchos lectores la omiten.
+    """
+
+    def __init__(self, df, version):
+        self.version = version
+        self._frame = df
+        self._positions = {}
+        for col in ('msisdn', 'iccid'):
+            if col not in df.columns:
+                continue
+            for pos, value in enumerate(df[col].tolist()):
+                if value is None or value is pd.NA:
+                    continue
+                key = normalize_code(value)
+                self._positions.setdefault(key, pos)
+                if col == 'iccid' and key.endswith('F'):
+                    self._positions.setdefault(key[:-1], pos)
+
+    def lookup(self, codes):
+        """Resuelve una lista de códigos.
+
+        Regresa (DataFrame de encontrados con la columna 'codigo', lista de
+        códigos no encontrados). Los códigos repetidos se resuelven una vez.
+        """
+        found_codes, positions, missing = [], [], []
+        for code in dict.fromkeys(normalize_code(c) for c in codes):
+            pos = self._positions.get(code)
+            if pos is None:
+                missing.append(code)
+            else:
+                found_codes.append(code)
+                positions.append(pos)
+
+        columns = [c for c in RESULT_COLUMNS if c in self._frame.columns]
+        found = self._frame.take(positions)[columns].reset_index(drop=True)
+        found.insert(0, 'codigo', found_codes)
+        return found, missing
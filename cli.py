@@ -0,0 +1,249 @@
+"""Línea de comandos para operaciones masivas sin Streamlit (cron, servidores).
+
+Ejemplos:
+    python cli.py importar esims.csv --bloque 1000 --reporte fallos.xlsx
+    python cli.py exportar inventario.xlsx
+    python cli.py asignar --a BT287 --cantidad 50 --producto MOV --salida entrega.csv
+    python cli.py respaldo
+    python cli.py auditar-qr --salida sin_qr.csv
+    python cli.py zip-qr qr_disponibles.zip --estado Disponible
+
+Códigos de salida: 0 éxito, 1 hubo registros con fallos, 2 error en datos o
+argumentos, 3 error de conexión o configuración.
+"""
+import os
+import sys
+import shutil
+import zipfile
+import argparse
+
+import pandas as pd
+from dotenv import load_dotenv
+from openpyxl.utils.exceptions import InvalidFileException
+from supabase import acreate_client
+
+from data_layer import DataLayer
+from import_engine import IMPORT_CHUNK_SIZE, TABLE_NAME, import_file, export_inventory
+from snapshot_store import fetch_all
+from allocator import EsimAllocator
+from backup_manager import create_backup
+from qr_service import QR_AUDIT_MAX_AGE_HOURS, MANIFEST_COLUMNS, build_qr_zip, run_qr_audit, load_qr_audit
+from batch_lookup import parse_codes
+from template_generator import write_report
+
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_DATA_ERROR = 2
+EXIT_CONNECTION_ERROR = 3
+
+# Errores al leer o validar archivos (xlsx corrupto, encabezado inválido,
+# errores de parseo de pandas/openpyxl): se reportan como error en datos
+DATA_ERRORS = (ValueError, KeyError, UnicodeDecodeError, zipfile.BadZipFile, InvalidFileException)
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def connect():
+    load_dotenv()
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("Variables de entorno SUPABASE_URL y SUPABASE_KEY no configuradas")
+    return DataLayer(lambda: acreate_client(url, key))
+
+
+def check_args(args):
+    """Revisa los argumentos antes de conectar; regresa un mensaje de error o None"""
+    if args.comando == "zip-qr" and args.iccids and not os.path.isfile(args.iccids):
+        return f"No existe el archivo {args.iccids}"
+    if args.comando == "importar":
+        if not os.path.isfile(args.archivo):
+            return f"No existe el archivo {args.archivo}"
+        if not os.access(args.archivo, os.R_OK):
+            return f"No se puede leer el archivo {args.archivo}"
+        if not args.archivo.endswith(('.csv', '.xlsx')):
+            return f"Formato no soportado: {args.archivo} (solo .csv o .xlsx)"
+    if getattr(args, "bloque", 1) < 1 or getattr(args, "cantidad", 1) < 1:
+        return "--bloque y --cantidad deben ser mayores a 0"
+    return None
+
+
+def cmd_importar(client, args):
+    def progress(stats):
+        log(f"  {stats.read} leídos | {stats.imported} importados | "
+            f"{len(stats.duplicates)} duplicados | {len(stats.failed)} fallidos | "
+            f"{stats.throughput:.0f} reg/s")
+
+    stats = import_file(client, args.archivo, chunk_size=args.bloque, dry_run=args.simular, progress=progress)
+
+    log(f"{'🧪 Simulación' if args.simular else '✅ Importación'} terminada en {stats.elapsed:.1f} s "
+        f"({stats.throughput:.0f} reg/s)")
+    log(f"  Leídos: {stats.read} | Importados: {stats.imported} | Duplicados: {len(stats.duplicates)} | "
+        f"Fallidos: {len(stats.failed)} | Bloques inválidos: {len(stats.invalid)}")
+    for message in stats.invalid:
+        log(f"  {message}")
+
+    if args.reporte and (stats.failed or stats.duplicates):
+        sheets = {}
+        if stats.duplicates:
+            sheets['Duplicados'] = pd.DataFrame(stats.duplicates)
+        if stats.failed:
+            sheets['Fallos'] = pd.DataFrame(stats.failed)
+        write_report(sheets, args.reporte)
+        log(f"📄 Reporte guardado en {args.reporte}")
+
+    if stats.invalid and stats.valid == 0:
+        return EXIT_DATA_ERROR
+    if stats.invalid or stats.failed:
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def cmd_exportar(client, args):
+    total = export_inventory(client, args.salida)
+    log(f"✅ {total} registros exportados a {args.salida}")
+    return EXIT_OK
+
+
+def cmd_asignar(client, args):
+    disponibles = pd.DataFrame(fetch_all(
+        client, TABLE_NAME, columns='id, producto, ip, estado',
+        query=lambda q: q.eq('estado', 'Disponible')
+    ))
+    allocator = EsimAllocator(disponibles, version=0)
+    claimed = allocator.claim(client, args.a, n=args.cantidad, producto=args.producto, ip=args.ip)
+
+    if args.salida and claimed:
+        pd.DataFrame(claimed).to_csv(args.salida, index=False)
+        log(f"📄 Entrega guardada en {args.salida}")
+    log(f"✅ {len(claimed)} de {args.cantidad} eSIMs asignadas a {args.a}")
+    return EXIT_OK if len(claimed) == args.cantidad else EXIT_PARTIAL
+
+
+def cmd_respaldo(client, args):
+    entry = create_backup(client)
+    log(f"✅ Respaldo {entry['tipo']}: {entry['filas']} registros, {entry['eliminados']} eliminados "
+        f"({entry['bytes'] / 1024:.1f} KB) -> {entry['archivo']}")
+    return EXIT_OK
+
+
+def cmd_auditar_qr(client, args):
+    iccids = [row['iccid'] for row in fetch_all(client, TABLE_NAME, columns='iccid') if row.get('iccid')]
+    last_logged = [0.0]
+
+    def progress(fraction):
+        if fraction - last_logged[0] >= 0.1 or fraction >= 1:
+            last_logged[0] = fraction
+            log(f"  {fraction:.0%} revisado")
+
+    checked = run_qr_audit(iccids, max_age_hours=args.horas, progress=progress)
+
+    audit = load_qr_audit()
+    sin_qr = audit[(audit['status'] == 404) & audit['iccid'].isin(iccids)]
+    log(f"✅ Auditoría terminada: {checked} revisadas, {len(iccids) - checked} desde caché, {len(sin_qr)} sin QR")
+    if args.salida and not sin_qr.empty:
+        sin_qr.to_csv(args.salida, index=False)
+        log(f"📄 eSIMs sin QR guardadas en {args.salida}")
+    return EXIT_OK
+
+
+def cmd_zip_qr(client, args):
+    def query(q):
+        for column in ('estado', 'producto', 'ip'):
+            if getattr(args, column):
+                q = q.eq(column, getattr(args, column))
+        return q
+
+    records = fetch_all(client, TABLE_NAME, columns=', '.join(MANIFEST_COLUMNS), query=query)
+    if args.iccids:
+        with open(args.iccids, encoding='utf-8', errors='ignore') as f:
+            wanted = set(parse_codes(f.read()))
+        records = [r for r in records if r.get('iccid') in wanted]
+    if not records:
+        log("⚠️ No hay eSIMs seleccionadas")
+        return EXIT_DATA_ERROR
+
+    last_logged = [0.0]
+
+    def progress(fraction):
+        if fraction - last_logged[0] >= 0.1 or fraction >= 1:
+            last_logged[0] = fraction
+            log(f"  {fraction:.0%} descargado")
+
+    zip_file, missing = build_qr_zip(records, progress=progress)
+    with zip_file, open(args.salida, 'wb') as out:
+        shutil.copyfileobj(zip_file, out)
+    log(f"✅ {len(records) - len(missing)} QR empaquetados en {args.salida}")
+    if missing:
+        log(f"⚠️ {len(missing)} eSIMs sin QR (ver manifest.csv)")
+        return EXIT_PARTIAL
+    return EXIT_OK
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Operaciones masivas del inventario eSIM BAITEL")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    importar = subparsers.add_parser("importar", help="Importa un archivo .csv o .xlsx con el formato de la plantilla")
+    importar.add_argument("archivo")
+    importar.add_argument("--bloque", type=int, default=IMPORT_CHUNK_SIZE, help="Registros por bloque")
+    importar.add_argument("--simular", action="store_true", help="Valida y detecta duplicados sin insertar")
+    importar.add_argument("--reporte", help="Ruta .xlsx para el reporte de duplicados y fallos")
+    importar.set_defaults(func=cmd_importar)
+
+    exportar = subparsers.add_parser("exportar", help="Exporta el inventario completo a .xlsx o .csv")
+    exportar.add_argument("salida")
+    exportar.set_defaults(func=cmd_exportar)
+
+    asignar = subparsers.add_parser("asignar", help="Asigna las siguientes eSIMs disponibles")
+    asignar.add_argument("--a", required=True, help="Distribuidor o cliente al que se asignan")
+    asignar.add_argument("--cantidad", type=int, default=1)
+    asignar.add_argument("--producto", choices=["MOV", "IP"])
+    asignar.add_argument("--ip")
+    asignar.add_argument("--salida", help="Ruta .csv con las eSIMs entregadas")
+    asignar.set_defaults(func=cmd_asignar)
+
+    respaldo = subparsers.add_parser("respaldo", help="Crea un respaldo incremental")
+    respaldo.set_defaults(func=cmd_respaldo)
+
+    auditar_qr = subparsers.add_parser("auditar-qr", help="Revisa que cada eSIM tenga su QR en el repositorio")
+    auditar_qr.add_argument("--horas", type=float, default=QR_AUDIT_MAX_AGE_HOURS,
+                            help="Vuelve a revisar los resultados más viejos que estas horas")
+    auditar_qr.add_argument("--salida", help="Ruta .csv con las eSIMs sin QR")
+    auditar_qr.set_defaults(func=cmd_auditar_qr)
+
+    zip_qr = subparsers.add_parser("zip-qr", help="Empaqueta en un ZIP los QR de las eSIMs seleccionadas")
+    zip_qr.add_argument("salida")
+    zip_qr.add_argument("--iccids", help="Archivo de texto con los ICCID (uno por línea)")
+    zip_qr.add_argument("--estado", choices=["Disponible", "Usado"])
+    zip_qr.add_argument("--producto", choices=["MOV", "IP"])
+    zip_qr.add_argument("--ip")
+    zip_qr.set_defaults(func=cmd_zip_qr)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    error = check_args(args)
+    if error:
+        log(f"❌ {error}")
+        return EXIT_DATA_ERROR
+    try:
+        client = connect()
+    except Exception as e:
+        log(f"❌ Error conectando a Supabase: {str(e)}")
+        return EXIT_CONNECTION_ERROR
+    try:
+        return args.func(client, args)
+    except DATA_ERRORS as e:
+        log(f"❌ Error en los datos: {type(e).__name__}: {str(e)}")
+        return EXIT_DATA_ERROR
+    except Exception as e:
+        log(f"❌ Error: {str(e)}")
+        return EXIT_CONNECTION_ERROR
+
+
+if __name__ == "__main__":
+    sys.exit(main())
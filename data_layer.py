@@ -0,0 +1,92 @@
+import os
+import random
+import asyncio
+import threading
+
+import httpx
+
+# Tiempo máximo por consulta a Supabase (segundos)
+DB_TIMEOUT = float(os.getenv("DB_TIMEOUT", "10"))
+
+# Reintentos ante errores de red o timeouts
+DB_RETRIES = int(os.getenv("DB_RETRIES", "3"))
+
+_BACKOFF_SECONDS = 0.25
+
+_READ_METHODS = ("GET", "HEAD")
+
+
+class DataLayer:
+    """Acceso a Supabase con el cliente asíncrono de PostgREST.
+
+    Un solo event loop vive en un hilo de fondo por proceso y mantiene el pool
+    de conexiones keep-alive de httpx. Cada consulta lleva timeout y reintentos
+    con backoff exponencial; las lecturas se reintentan ante cualquier error de
+    red y las escrituras solo si la conexión no llegó a establecerse.
+
+    table() regresa un constructor de consultas con la misma API que el cliente
+    síncrono de supabase (..., .execute()), así que el código existente funciona
+    igual. gather() ejecuta varias consultas independientes en paralelo, de modo
+    que la latencia es la de la más lenta y no la suma.
+    """
+
+    def __init__(self, client_factory, timeout=DB_TIMEOUT, retries=DB_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="supabase-io", daemon=True)
+        self._thread.start()
+        self.client = self._run(client_factory())
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _execute(self, builder):
+        is_read = getattr(builder, "http_method", "GET") in _READ_METHODS
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.wait_for(builder.execute(), self.timeout)
+            except (asyncio.TimeoutError, httpx.TransportError) as e:
+                retryable = is_read or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt == self.retries:
+                    raise
+            await asyncio.sleep(_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random()))
+
+    def table(self, table_name):
+        return SyncQuery(self, self.client.table(table_name))
+
+    def execute(self, query):
+        return self._run(self._execute(_unwrap(query)))
+
+    def gather(self, *queries):
+        """Ejecuta consultas independientes en paralelo y regresa sus respuestas en orden"""
+        async def run_all():
+            return await asyncio.gather(*(self._execute(_unwrap(q)) for q in queries))
+        return self._run(run_all())
+
+
+def _unwrap(query):
+    return query.builder if isinstance(query, SyncQuery) else query
+
+
+class SyncQuery:
+    """Fachada síncrona sobre un constructor de consultas asíncrono de PostgREST"""
+
+    def __init__(self, layer, builder):
+        self.layer = layer
+        self.builder = builder
+
+    def __getattr__(self, name):
+        attr = getattr(self.builder, name)
+        if not callable(attr):
+            return self._wrap(attr)
+
+        def method(*args, **kwargs):
+            return self._wrap(attr(*args, **kwargs))
+        return method
+
+    def _wrap(self, value):
+        return SyncQuery(self.layer, value) if hasattr(value, "execute") else value
+
+    def execute(self):
+        return self.layer.execute(self.builder)
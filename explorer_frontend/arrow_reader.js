@@ -0,0 +1,183 @@
+// Lector mínimo de streams Arrow IPC para el explorador de inventario.
+//
+// Solo cubre lo que genera inventory_explorer.build_payload: columnas int64
+// y utf8, sin compresión por bloque ni diccionarios. Se distribuye junto al
+// componente para no cargar código de terceros desde un CDN.
+(function (global) {
+  "use strict";
+
+  const CONTINUATION = 0xffffffff;
+  const HEADER_SCHEMA = 1;
+  const HEADER_RECORD_BATCH = 3;
+  const TYPE_INT = 2;
+  const TYPE_UTF8 = 5;
+
+  // Acceso a tablas flatbuffers (vtable + campos) sobre un DataView
+  class Table {
+    constructor(view, position) {
+      this.view = view;
+      this.position = position;
+      this.vtable = position - view.getInt32(position, true);
+      this.vtableSize = view.getUint16(this.vtable, true);
+    }
+
+    offset(field) {
+      const slot = 4 + field * 2;
+      return slot < this.vtableSize ? this.view.getUint16(this.vtable + slot, true) : 0;
+    }
+
+    uint8(field, fallback) {
+      const o = this.offset(field);
+      return o ? this.view.getUint8(this.position + o) : fallback;
+    }
+
+    int32(field, fallback) {
+      const o = this.offset(field);
+      return o ? this.view.getInt32(this.position + o, true) : fallback;
+    }
+
+    int64(field, fallback) {
+      const o = this.offset(field);
+      return o ? Number(this.view.getBigInt64(this.position + o, true)) : fallback;
+    }
+
+    indirect(field) {
+      const o = this.offset(field);
+      if (!o) return null;
+      const at = this.position + o;
+      return at + this.view.getUint32(at, true);
+    }
+
+    table(field) {
+      const at = this.indirect(field);
+      return at === null ? null : new Table(this.view, at);
+    }
+
+    string(field) {
+      const at = this.indirect(field);
+      if (at === null) return null;
+      const length = this.view.getUint32(at, true);
+      return utf8.decode(new Uint8Array(this.view.buffer, this.view.byteOffset + at + 4, length));
+    }
+
+    // Vector de tablas o de structs de tamaño fijo: regresa [posición del elemento]
+    vector(field, structSize) {
+      const at = this.indirect(field);
+      if (at === null) return [];
+      const length = this.view.getUint32(at, true);
+      const items = [];
+      for (let i = 0; i < length; i++) {
+        const element = at + 4 + i * (structSize || 4);
+        items.push(structSize ? element : element + this.view.getUint32(element, true));
+      }
+      return items;
+    }
+  }
+
+  const utf8 = new TextDecoder("utf-8");
+
+  function readSchema(header) {
+    return header.vector(1).map((position) => {
+      const field = new Table(header.view, position);
+      const typeId = field.uint8(2, 0);
+      const type = field.table(3);
+      if (typeId === TYPE_INT && type.int32(0, 0) === 64) return { name: field.string(0), kind: "int64" };
+      if (typeId === TYPE_UTF8) return { name: field.string(0), kind: "utf8" };
+      throw new Error("Tipo Arrow no soportado en la columna " + field.string(0));
+    });
+  }
+
+  function isValid(bitmap, i) {
+    return bitmap === null || ((bitmap[i >> 3] >> (i & 7)) & 1) === 1;
+  }
+
+  function readInt64(body, buffers, length, nullCount, target) {
+    const bitmap = nullCount ? buffers[0] : null;
+    const data = new DataView(body.buffer, buffers[1].byteOffset, buffers[1].byteLength);
+    for (let i = 0; i < length; i++) {
+      target.push(isValid(bitmap, i) ? Number(data.getBigInt64(i * 8, true)) : null);
+    }
+  }
+
+  function readUtf8(body, buffers, length, nullCount, target) {
+    const bitmap = nullCount ? buffers[0] : null;
+    const offsets = new DataView(body.buffer, buffers[1].byteOffset, buffers[1].byteLength);
+    const bytes = buffers[2];
+    // Texto ASCII (ICCID, MSISDN, códigos): se decodifica una sola vez y se corta
+    let ascii = true;
+    for (let i = 0; i < bytes.length; i++) {
+      if (bytes[i] > 0x7f) { ascii = false; break; }
+    }
+    const whole = ascii ? utf8.decode(bytes) : null;
+    for (let i = 0; i < length; i++) {
+      if (!isValid(bitmap, i)) { target.push(null); continue; }
+      const start = offsets.getInt32(i * 4, true);
+      const end = offsets.getInt32(i * 4 + 4, true);
+      target.push(ascii ? whole.slice(start, end) : utf8.decode(bytes.subarray(start, end)));
+    }
+  }
+
+  function readRecordBatch(header, body, fields, columns) {
+    const length = header.int64(0, 0);
+    const nodes = header.vector(1, 16);
+    const buffers = header.vector(2, 16).map((position) => {
+      const offset = Number(header.view.getBigInt64(position, true));
+      const size = Number(header.view.getBigInt64(position + 8, true));
+      return body.subarray(offset, offset + size);
+    });
+    if (header.table(3)) throw new Error("Compresión por bloque de Arrow no soportada");
+
+    let next = 0;
+    fields.forEach((field, i) => {
+      const nullCount = Number(header.view.getBigInt64(nodes[i] + 8, true));
+      const count = field.kind === "utf8" ? 3 : 2;
+      const own = buffers.slice(next, next + count);
+      next += count;
+      const read = field.kind === "utf8" ? readUtf8 : readInt64;
+      read(body, own, length, nullCount, columns[field.name]);
+    });
+    return length;
+  }
+
+  // Lee un stream Arrow IPC completo: { numRows, fields: [nombre], columns: { nombre: [valores] } }
+  function readStream(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+    let position = 0;
+    let fields = null;
+    const columns = {};
+    let numRows = 0;
+
+    while (position + 8 <= bytes.byteLength) {
+      let size = view.getInt32(position, true);
+      position += 4;
+      if (size === -1 || (size >>> 0) === CONTINUATION) {
+        size = view.getInt32(position, true);
+        position += 4;
+      }
+      if (size === 0) break;  // fin del stream
+
+      const metadata = new DataView(bytes.buffer, bytes.byteOffset + position, size);
+      const message = new Table(metadata, metadata.getUint32(0, true));
+      position += size;
+      const bodyLength = message.int64(3, 0);
+      const body = bytes.subarray(position, position + bodyLength);
+      position += bodyLength;
+
+      const headerType = message.uint8(1, 0);
+      const header = message.table(2);
+      if (headerType === HEADER_SCHEMA) {
+        fields = readSchema(header);
+        fields.forEach((field) => { columns[field.name] = []; });
+      } else if (headerType === HEADER_RECORD_BATCH) {
+        if (!fields) throw new Error("Stream Arrow sin esquema");
+        numRows += readRecordBatch(header, body, fields, columns);
+      } else {
+        throw new Error("Mensaje Arrow no soportado: " + headerType);
+      }
+    }
+    if (!fields) throw new Error("Stream Arrow vacío");
+    return { numRows: numRows, fields: fields.map((f) => f.name), columns: columns };
+  }
+
+  global.ArrowReader = { readStream: readStream };
+})(typeof window !== "undefined" ? window : globalThis);
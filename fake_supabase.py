@@ -0,0 +1,190 @@
+"""Tabla esim_data en memoria con la API del cliente asíncrono de Supabase.
+
+Sirve para pruebas de carga sin tocar la base real: implementa solo las
+consultas que usa la aplicación (select/insert/update/delete con eq, gt,
+gte, in_, order y range), simula la latencia de red por consulta y cuenta las
+llamadas por tipo.
+"""
+import copy
+import asyncio
+import threading
+from collections import Counter
+
+_METHODS = {'select': 'GET', 'insert': 'POST', 'update': 'PATCH', 'delete': 'DELETE'}
+
+UNIQUE_COLUMNS = ('iccid', 'msisdn')
+
+
+def _sort_key(value):
+    # Números antes que texto para comparar ids y fechas sin mezclar tipos
+    return (0, value, '') if isinstance(value, (int, float)) else (1, 0, str(value))
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+
+class FakeQuery:
+    """Constructor de consultas: cada filtro regresa la misma consulta, execute() es asíncrono"""
+
+    def __init__(self, table, operation, payload=None, columns='*'):
+        self.table = table
+        self.operation = operation
+        self.payload = payload
+        self.columns = columns
+        self.filters = []
+        self._order = None
+        self._range = None
+
+    @property
+    def http_method(self):
+        return _METHODS[self.operation]
+
+    def select(self, columns='*', count=None):
+        self.operation, self.columns = 'select', columns
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: row.get(column) != value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _sort_key(row[column]) > _sort_key(value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and _sort_key(row[column]) >= _sort_key(value))
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column, desc=False):
+        self._order = (column, desc)
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def limit(self, n):
+        self._range = (0, n - 1)
+        return self
+
+    async def execute(self):
+        self.table.calls[self.operation] += 1
+        if self.table.latency:
+            await asyncio.sleep(self.table.latency)
+        with self.table.lock:
+            return FakeResponse(getattr(self, f"_{self.operation}")())
+
+    def _matching(self):
+        return [row for row in self.table.rows if all(f(row) for f in self.filters)]
+
+    def _select(self):
+        rows = self._matching()
+        if self._order:
+            column, desc = self._order
+            rows.sort(key=lambda row: _sort_key(row.get(column)), reverse=desc)
+        if self._range:
+            rows = rows[self._range[0]:self._range[1] + 1]
+        if self.columns.strip() == '*':
+            return [dict(row) for row in rows]
+        columns = [c.strip() for c in self.columns.split(',')]
+        return [{c: row.get(c) for c in columns} for row in rows]
+
+    def _insert(self):
+        records = self.payload if isinstance(self.payload, list) else [self.payload]
+        taken = {c: {row.get(c) for row in self.table.rows} for c in UNIQUE_COLUMNS}
+        for record in records:
+            for column in UNIQUE_COLUMNS:
+                if record.get(column) is not None and record[column] in taken[column]:
+                    raise Exception(f'duplicate key value violates unique constraint "esim_data_{column}_key"')
+                taken[column].add(record.get(column))
+        inserted = []
+        for record in records:
+            self.table.next_id += 1
+            inserted.append(dict(record, id=self.table.next_id))
+        self.table.rows.extend(inserted)
+        return copy.deepcopy(inserted)
+
+    def _update(self):
+        rows = self._matching()
+        for row in rows:
+            row.update(self.payload)
+        return [dict(row) for row in rows]
+
+    def _delete(self):
+        rows = self._matching()
+        deleted = {id(row) for row in rows}
+        self.table.rows = [row for row in self.table.rows if id(row) not in deleted]
+        return rows
+
+
+class FakeTable:
+    """Filas de esim_data, latencia simulada por consulta y contador de llamadas"""
+
+    def __init__(self, rows=1000, latency=0.0):
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.calls = Counter()
+        self.rows = [sample_row(i) for i in range(1, rows + 1)]
+        self.next_id = rows
+
+    def select(self, columns='*', count=None):
+        return FakeQuery(self, 'select', columns=columns)
+
+    def insert(self, payload):
+        return FakeQuery(self, 'insert', payload)
+
+    def update(self, payload):
+        return FakeQuery(self, 'update', payload)
+
+    def delete(self):
+        return FakeQuery(self, 'delete')
+
+
+class FakeClient:
+    def __init__(self, table):
+        self._table = table
+
+    def table(self, table_name):
+        return self._table
+
+
+def sample_row(i):
+    """eSIM de ejemplo: un tercio asignadas, productos e IPs alternados"""
+    usada = i % 3 == 0
+    return {
+        'id': i,
+        'iccid': f"89521400{i:012d}F",
+        'msisdn': f"22{i:08d}",
+        'imsi': f"3340{i:011d}",
+        'pin': '1234',
+        'puk': f"{i:08d}",
+        'serie': str(i),
+        'producto': 'MOV' if i % 2 else 'IP',
+        'ip': f"CB{i % 5}",
+        'estado': 'Usado' if usada else 'Disponible',
+        'asignado_a': f"BT{i % 300}" if usada else None,
+        'distribuidor': 'BAITEL',
+        'image_index': None,
+        'fecha_creacion': '2024-01-01T00:00:00',
+        'fecha_asignacion': f"2024-02-{1 + i % 28:02d}T10:00:00" if usada else None,
+        'fecha_ultimo_cambio': f"2024-01-{1 + i % 28:02d}T10:00:00",
+    }
+
+
+def client_factory(table):
+    """Reemplazo de supabase.acreate_client que regresa un cliente sobre table"""
+    async def acreate_client(*args, **kwargs):
+        return FakeClient(table)
+    return acreate_client
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Columnas de baja cardinalidad con bitmap por valor
+INDEXED_COLUMNS = ['estado', 'producto', 'ip']
+
+# Columnas donde busca el cuadro "Buscar"
+SEARCH_COLUMNS = ['iccid', 'msisdn', 'imsi', 'serie', 'asignado_a', 'distribuidor', 'ip', 'producto', 'estado']
+
+# Máximo de combinaciones de filtros recordadas por proceso
+MAX_CACHED_FILTERS = 256
+
+_SEPARATOR = '\x1f'
+
+
+class FilterIndex:
+    """Índice de filtros construido una sola vez por versión de datos.
+
+    Cada valor de las columnas indexadas tiene un bitmap (arreglo booleano del
+    largo del inventario). Una combinación de filtros se resuelve con AND entre
+    columnas y OR entre valores de la misma columna, y el resultado (posiciones
+    de fila) se guarda en un LRU compartido por todas las sesiones.
+    """
+
+    def __init__(self, df, version):
+        self.version = version
+        self.size = len(df)
+        self.bitmaps = {}
+        for col in INDEXED_COLUMNS:
+            if col not in df.columns or df.empty:
+                self.bitmaps[col] = {}
+                continue
+            codes, uniques = df[col].factorize(use_na_sentinel=True)
+            codes = np.asarray(codes)
+            self.bitmaps[col] = {value: codes == i for i, value in enumerate(uniques)}
+
+        # Texto en minúsculas por fila para la búsqueda, se arma de forma perezosa
+        self._frame = df
+        self._haystack = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def options(self, col):
+        """Valores distintos de una columna indexada (para los selectores)"""
+        return sorted(str(v) for v in self.bitmaps.get(col, {}))
+
+    def count(self, col, value):
+        bitmap = self.bitmaps.get(col, {}).get(value)
+        return int(bitmap.sum()) if bitmap is not None else 0
+
+    def _mask(self, col, values):
+        mask = np.zeros(self.size, dtype=bool)
+        for value in values:
+            bitmap = self.bitmaps.get(col, {}).get(value)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def _search_mask(self, query):
+        if self._haystack is None:
+            columns = [c for c in SEARCH_COLUMNS if c in self._frame.columns]
+            parts = [self._frame[c].astype(object).where(self._frame[c].notna(), '').astype(str) for c in columns]
+            haystack = parts[0].str.cat(parts[1:], sep=_SEPARATOR) if parts else self._frame.index.astype(str)
+            self._haystack = haystack.str.lower()
+        return self._haystack.str.contains(query.lower(), regex=False, na=False).to_numpy(dtype=bool)
+
+    def positions(self, filters, search=''):
+        """Posiciones de las filas que cumplen los filtros.
+
+        filters es un dict columna -> lista de valores aceptados (lista vacía o
+        None significa "Todos").
+        """
+        key = (self.version, tuple(sorted((c, tuple(sorted(map(str, v)))) for c, v in filters.items() if v)), search)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        mask = np.ones(self.size, dtype=bool)
+        for col, values in filters.items():
+            if values:
+                mask &= self._mask(col, values)
+        if search:
+            mask &= self._search_mask(search)
+        result = np.flatnonzero(mask)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > MAX_CACHED_FILTERS:
+                self._cache.popitem(last=False)
+        return result
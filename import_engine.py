@@ -0,0 +1,246 @@
+import time
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from openpyxl import load_workbook
+
+from snapshot_store import fetch_all
+from template_generator import validate_import_data, write_report
+
+TABLE_NAME = 'esim_data'
+
+# Registros por INSERT en la carga masiva
+IMPORT_CHUNK_SIZE = 500
+
+# Valores que llegan en los archivos y se guardan como NULL
+NULL_TOKENS = ['', 'nan', 'NaN', 'NAN', 'None', 'none', 'null', 'NULL', 'NaT', 'N/A', '#N/A']
+_NULL_SET = pa.array(NULL_TOKENS)
+
+# Columnas de identificadores: Excel los convierte a número ("1234.0")
+IDENTIFIER_COLUMNS = ['iccid', 'msisdn', 'imsi', 'pin', 'puk', 'serie']
+
+# Longitud fija de PIN/PUK (Excel quita los ceros a la izquierda). MSISDN e IMSI
+# nunca empiezan con 0: no se rellenan y validate_import_data revisa su longitud
+IDENTIFIER_WIDTHS = {'pin': 4, 'puk': 8}
+
+# Fechas que se llenan con la hora de la importación si vienen vacías
+TIMESTAMP_COLUMNS = ['fecha_creacion', 'fecha_ultimo_cambio']
+
+
+def normalize_import(df):
+    """Limpia un bloque de importación columna por columna, sin recorrer filas.
+
+    Quita espacios, convierte los vacíos y 'nan'/'None'/... a None, quita el
+    ".0" que Excel agrega a los identificadores, completa con ceros a la
+    izquierda PIN/PUK y pasa el ICCID a mayúsculas.
+    """
+    columns = {}
+    for column in df.columns:
+        name = str(column).strip()
+        values = pa.array(df[column].astype('string[pyarrow]'))
+        values = pc.utf8_trim_whitespace(values)
+        values = pc.if_else(pc.is_in(values, value_set=_NULL_SET), None, values)
+        if name in IDENTIFIER_COLUMNS:
+            values = pc.replace_substring_regex(values, pattern=r'^(\d+)\.0$', replacement=r'\1')
+        if name in IDENTIFIER_WIDTHS:
+            digits = pc.match_substring_regex(values, pattern=r'^\d+$')
+            values = pc.if_else(digits, pc.utf8_lpad(values, width=IDENTIFIER_WIDTHS[name], padding='0'), values)
+        if name == 'iccid':
+            values = pc.utf8_upper(values)
+        columns[name] = pd.Series(values.to_numpy(zero_copy_only=False), index=df.index, dtype=object)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def record_batches(df, chunk_size=IMPORT_CHUNK_SIZE):
+    """Genera bloques de registros listos para insertar.
+
+    Las fechas vacías de TIMESTAMP_COLUMNS se llenan con un solo timestamp
+    por bloque y los valores nulos quedan como None.
+    """
+    names = list(df.columns) + [c for c in TIMESTAMP_COLUMNS if c not in df.columns]
+    values = {
+        name: df[name].astype(object).where(df[name].notna(), None).tolist() if name in df.columns else [None] * len(df)
+        for name in names
+    }
+    for start in range(0, len(df), chunk_size):
+        now = datetime.now().isoformat()
+        columns = [values[name][start:start + chunk_size] for name in names]
+        for i, name in enumerate(names):
+            if name in TIMESTAMP_COLUMNS:
+                columns[i] = [now if value is None else value for value in columns[i]]
+        yield [dict(zip(names, row)) for row in zip(*columns)]
+
+
+def read_import_file(file):
+    """Lee completo un archivo de importación (.csv o .xlsx) como texto, ya normalizado"""
+    name = getattr(file, 'name', str(file))
+    if name.endswith('.csv'):
+        return normalize_import(pd.read_csv(file, dtype=str, keep_default_na=False))
+    return normalize_import(pd.read_excel(file, dtype=str, keep_default_na=False))
+
+
+def iter_import_file(path, chunk_size=IMPORT_CHUNK_SIZE):
+    """Lee un archivo de importación por bloques normalizados sin cargarlo completo en memoria"""
+    if str(path).endswith('.csv'):
+        for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+            yield normalize_import(chunk)
+        return
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(h) for h in next(rows, ())]
+        block = []
+        for row in rows:
+            block.append([None if v is None else str(v) for v in row])
+            if len(block) == chunk_size:
+                yield normalize_import(pd.DataFrame(block, columns=header))
+                block = []
+        if block:
+            yield normalize_import(pd.DataFrame(block, columns=header))
+    finally:
+        workbook.close()
+
+
+def existing_keys(client):
+    """ICCIDs y MSISDNs que ya existen en la base de datos"""
+    rows = fetch_all(client, TABLE_NAME, columns='iccid, msisdn')
+    return (
+        {row['iccid'] for row in rows if row.get('iccid')},
+        {row['msisdn'] for row in rows if row.get('msisdn')},
+    )
+
+
+def split_duplicates(df, existing_iccids, existing_msisdns):
+    """Separa (nuevos, duplicados) por ICCID o MSISDN ya existente"""
+    duplicate_mask = df['iccid'].isin(existing_iccids) | df['msisdn'].isin(existing_msisdns)
+    return df[~duplicate_mask], df[duplicate_mask]
+
+
+def _failure(record, error):
+    error_msg = str(error)
+    if 'duplicate' in error_msg.lower() or 'unique constraint' in error_msg.lower():
+        motivo = 'Duplicado (ICCID o MSISDN ya existe)'
+    else:
+        motivo = f'Error: {error_msg[:100]}'
+    return {
+        'iccid': record.get('iccid', 'N/A'),
+        'msisdn': record.get('msisdn', 'N/A'),
+        'motivo': motivo,
+    }
+
+
+def insert_records(client, records):
+    """Inserta un bloque con un solo INSERT; si falla, registro por registro.
+
+    Así un duplicado o un dato inválido no tumba el bloque completo. Regresa
+    (número importado, lista de fallos con iccid/msisdn/motivo).
+    """
+    if not records:
+        return 0, []
+    try:
+        client.table(TABLE_NAME).insert(records).execute()
+        return len(records), []
+    except Exception:
+        pass
+
+    imported, failed = 0, []
+    for record in records:
+        try:
+            client.table(TABLE_NAME).insert([record]).execute()
+            imported += 1
+        except Exception as insert_error:
+            failed.append(_failure(record, insert_error))
+    return imported, failed
+
+
+def import_dataframe(client, df, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """Importa un DataFrame ya normalizado, validado y sin duplicados en bloques.
+
+    progress(hechos, total) se llama después de cada bloque. Regresa
+    (número importado, lista de fallos).
+    """
+    total_imported, failed_records, done = 0, [], 0
+    for records in record_batches(df, chunk_size):
+        imported, failed = insert_records(client, records)
+        total_imported += imported
+        failed_records.extend(failed)
+        done += len(records)
+        if progress:
+            progress(done, len(df))
+    return total_imported, failed_records
+
+
+class ImportStats:
+    """Contadores de una importación en streaming"""
+
+    def __init__(self):
+        self.read = 0
+        self.valid = 0
+        self.imported = 0
+        self.duplicates = []
+        self.failed = []
+        self.invalid = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def throughput(self):
+        return self.read / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def import_file(client, path, chunk_size=IMPORT_CHUNK_SIZE, dry_run=False, progress=None):
+    """Importa un archivo por bloques: valida, descarta duplicados e inserta.
+
+    Los duplicados se detectan contra la base de datos (una sola descarga de
+    ICCID/MSISDN) y contra los bloques anteriores del mismo archivo. Un bloque
+    inválido se reporta en stats.invalid y se omite. progress(stats) se llama
+    después de cada bloque.
+    """
+    stats = ImportStats()
+    existing_iccids, existing_msisdns = existing_keys(client)
+
+    for chunk in iter_import_file(path, chunk_size):
+        first_row = stats.read + 2  # +1 encabezado, +1 base 1
+        stats.read += len(chunk)
+
+        is_valid, validation_msg = validate_import_data(chunk)
+        if not is_valid:
+            stats.invalid.append(f"Filas {first_row}-{first_row + len(chunk) - 1}: {validation_msg}")
+            continue
+        stats.valid += len(chunk)
+
+        new_df, duplicates_df = split_duplicates(chunk, existing_iccids, existing_msisdns)
+        stats.duplicates.extend(duplicates_df[['iccid', 'msisdn']].to_dict('records'))
+        existing_iccids.update(new_df['iccid'].dropna())
+        existing_msisdns.update(new_df['msisdn'].dropna())
+
+        if not dry_run:
+            for records in record_batches(new_df, chunk_size):
+                imported, failed = insert_records(client, records)
+                stats.imported += imported
+                stats.failed.extend(failed)
+        if progress:
+            progress(stats)
+    return stats
+
+
+def fetch_inventory(client):
+    """Inventario completo (todas las columnas), del id más reciente al más antiguo"""
+    df = pd.DataFrame(fetch_all(client, TABLE_NAME))
+    return df.sort_values('id', ascending=False, ignore_index=True) if not df.empty else df
+
+
+def export_inventory(client, path):
+    """Exporta el inventario completo a .xlsx o .csv y regresa el número de registros"""
+    df = fetch_inventory(client)
+    if str(path).endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        write_report({'eSIM Data': df}, path)
+    return len(df)
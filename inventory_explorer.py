@@ -0,0 +1,50 @@
+import os
+import gzip
+
+import pyarrow as pa
+import streamlit.components.v1 as components
+
+# Columnas que recibe el navegador (sin PIN/PUK/IMSI)
+EXPLORER_COLUMNS = ['id', 'iccid', 'msisdn', 'producto', 'ip', 'estado', 'asignado_a', 'distribuidor', 'fecha_asignacion']
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "explorer_frontend")
+
+_component = components.declare_component("inventory_explorer", path=_FRONTEND_DIR)
+
+
+def build_payload(df):
+    """Inventario proyectado como Arrow IPC comprimido con gzip.
+
+    El navegador lo descomprime con DecompressionStream y lo lee con el
+    lector local explorer_frontend/arrow_reader.js, que solo soporta columnas
+    int64 y utf8, sin compresión por bloque ni diccionarios: por eso se
+    convierte todo a esos tipos y la compresión va sobre todo el buffer.
+    """
+    columns = [c for c in EXPLORER_COLUMNS if c in df.columns]
+    table = pa.Table.from_pandas(df[columns], preserve_index=False)
+    schema = pa.schema([
+        pa.field(name, pa.int64() if name == 'id' else pa.string())
+        for name in table.column_names
+    ])
+    table = table.cast(schema)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return gzip.compress(sink.getvalue().to_pybytes(), compresslevel=6)
+
+
+def inventory_explorer(payload, version, qr_base_url, colors=None, result=None, key=None):
+    """Explorador de inventario en el navegador.
+
+    payload (de build_payload) solo se decodifica en el navegador cuando
+    cambia version; filtros, búsqueda, orden y paginación no llaman al
+    servidor. Regresa la última acción del usuario o None:
+    {"accion": "detalle", "id": ..., "nonce": ...} o
+    {"accion": "asignar", "id": ..., "asignado_a": ..., "nonce": ...}.
+
+    result ({"nonce": ..., "mensaje": ...}) avisa al navegador que una
+    asignación falló, para que vuelva a habilitar la tarjeta.
+    """
+    return _component(payload=payload, version=version, qr_base_url=qr_base_url,
+                      colors=colors or {}, resultado=result, key=key, default=None)
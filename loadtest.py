@@ -0,0 +1,320 @@
+"""Prueba de carga: N sesiones simultáneas de la app contra una tabla falsa en memoria.
+
+Cada sesión es un AppTest de Streamlit que recorre un guion de operador
+(abrir, filtrar, buscar, abrir tarjeta, asignar, importar) contra
+fake_supabase con la latencia indicada. Por cada nivel de concurrencia se
+reporta la latencia p50/p95/p99 de las ejecuciones, las llamadas a Supabase
+y la memoria (RSS) del proceso.
+
+Ejemplos:
+    python loadtest.py --sesiones 1,5,10,20 --filas 2000 --latencia 0.05
+    python loadtest.py --sesiones 10 --repeticiones 3 --json resultados.json
+
+La importación se ejecuta con import_engine (AppTest no puede subir archivos
+al file_uploader), sobre la misma tabla falsa.
+"""
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import argparse
+import tempfile
+import threading
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+# PNG de 1x1 para sembrar la caché de QR y no salir a la red
+_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000100e221bc330000000049454e44ae426082"
+)
+
+STEPS = ['abrir', 'filtrar', 'buscar', 'abrir_tarjeta', 'asignar', 'importar']
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def rss_mb():
+    """Memoria residente actual del proceso en MB (pico si no hay /proc)"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def setup_environment(work_dir, rows, latency):
+    """Directorios temporales, tabla falsa y runtime compartido para las sesiones"""
+    for name in ('SNAPSHOT_DIR', 'BACKUP_DIR', 'QR_CACHE_DIR', 'PROFILE_DIR'):
+        os.environ[name] = os.path.join(work_dir, name.lower())
+    os.environ['QR_AUDIT_DB'] = os.path.join(work_dir, 'auditoria.sqlite')
+    os.environ.setdefault('SUPABASE_URL', 'http://fake-supabase')
+    os.environ.setdefault('SUPABASE_KEY', 'fake')
+
+    import supabase
+    from fake_supabase import FakeTable, client_factory
+    table = FakeTable(rows=rows, latency=latency)
+    supabase.acreate_client = client_factory(table)
+
+    os.makedirs(os.environ['QR_CACHE_DIR'], exist_ok=True)
+    for row in table.rows:
+        with open(os.path.join(os.environ['QR_CACHE_DIR'], f"{row['iccid']}.png"), 'wb') as f:
+            f.write(_PNG)
+
+    _share_runtime()
+    return table
+
+
+def _share_runtime():
+    # AppTest crea y borra Runtime._instance en cada ejecución; con sesiones en
+    # paralelo la que termina primero dejaría sin runtime a las demás. También
+    # compila el script por sesión, y compilar en varios hilos a la vez falla
+    # en Python 3.11: como el servidor real, todas comparten un ScriptCache.
+    from unittest.mock import MagicMock
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import local_script_runner
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+    config.set_option("global.appTest", True)
+
+
+def _widget(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"no se encontró el control '{label}'")
+
+
+class Session:
+    """Un operador: recorre el guion y mide cada ejecución del script"""
+
+    def __init__(self, number, table, app_path, import_dir, timeout):
+        self.number = number
+        self.table = table
+        self.app_path = app_path
+        self.import_dir = import_dir
+        self.timeout = timeout
+        self.timings = defaultdict(list)
+        self.errors = []
+        self.random = random.Random(number)
+
+    def _timed(self, step, action):
+        started = time.perf_counter()
+        try:
+            result = action()
+        except Exception as e:
+            self.errors.append(f"{step}: {type(e).__name__}: {e}")
+            return None
+        self.timings[step].append(time.perf_counter() - started)
+        return result
+
+    def _check(self, step, at):
+        if at is not None and at.exception:
+            self.errors.append(f"{step}: {at.exception[0].value}")
+            return None
+        return at
+
+    def run_script(self, repetition):
+        from streamlit.testing.v1 import AppTest
+        at = AppTest.from_file(self.app_path, default_timeout=self.timeout)
+
+        at = self._check('abrir', self._timed('abrir', at.run))
+        if at is None:
+            return
+        at = self._check('filtrar', self._timed(
+            'filtrar', lambda: _widget(at.sidebar.selectbox, "Estado").select("Disponible").run()))
+        if at is None:
+            return
+
+        with self.table.lock:
+            target = self.random.choice([row for row in self.table.rows if row['estado'] == 'Disponible'])
+        at = self._check('buscar', self._timed(
+            'buscar', lambda: _widget(at.sidebar.text_input, "🔎 Buscar").input(target['msisdn']).run()))
+        if at is None:
+            return
+
+        cards = [b for b in at.button if (b.key or '').startswith('card_')]
+        if cards:
+            at = self._check('abrir_tarjeta', self._timed('abrir_tarjeta', lambda: cards[0].click().run()))
+            if at is None:
+                return
+
+        at = self._check('asignar', self._timed('asignar', lambda: self._assign(at)))
+
+        self._timed('importar', lambda: self._import(repetition))
+
+    def _assign(self, at):
+        _widget(at.text_input, "Asignar a *").input(f"CARGA{self.number}")
+        return _widget(at.button, "⚡ Entregar").click().run()
+
+    def _import(self, repetition):
+        from import_engine import import_file
+
+        # Numeración global: cada importación de cualquier nivel trae ICCIDs nuevos
+        batch = next(_import_batches)
+        start = 10_000_000 + batch * 100
+        path = os.path.join(self.import_dir, f"lote_{batch}_sesion_{self.number}_{repetition}.csv")
+        numbers = range(start, start + 50)
+        pd.DataFrame({
+            'iccid': [f"89521499{i:012d}F" for i in numbers],
+            'msisdn': [f"55{i:08d}" for i in numbers],
+            'imsi': [f"3349{i:011d}" for i in numbers],
+            'pin': '1234',
+            'puk': [f"{i:08d}" for i in numbers],
+            'serie': [str(i) for i in numbers],
+            'producto': 'MOV',
+            'ip': 'CB1',
+            'estado': 'Disponible',
+            'distribuidor': 'BAITEL',
+        }).to_csv(path, index=False)
+        stats = import_file(_import_layer(self.table), path)
+        if stats.invalid or stats.failed:
+            raise RuntimeError(f"{stats.imported} importados, {stats.invalid or stats.failed[:1]}")
+        return stats
+
+
+_layer = None
+_layer_lock = threading.Lock()
+
+# Lotes de importación generados en toda la prueba (todos los niveles)
+_import_batches = itertools.count()
+
+
+def _import_layer(table):
+    # Un solo DataLayer para las importaciones, como el de la app
+    global _layer
+    from data_layer import DataLayer
+    from fake_supabase import client_factory
+    with _layer_lock:
+        if _layer is None:
+            _layer = DataLayer(lambda: client_factory(table)())
+        return _layer
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+
+
+def run_level(n_sessions, repetitions, table, app_path, import_dir, timeout):
+    """Corre n_sessions en paralelo y regresa el resumen del nivel"""
+    calls_before = Counter(table.calls)
+    sessions = [Session(i, table, app_path, import_dir, timeout) for i in range(n_sessions)]
+    barrier = threading.Barrier(n_sessions)
+
+    def worker(session):
+        barrier.wait()
+        for repetition in range(repetitions):
+            session.run_script(repetition)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(s,), name=f"sesion-{s.number}") for s in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    by_step = defaultdict(list)
+    for session in sessions:
+        for step, values in session.timings.items():
+            by_step[step].extend(values)
+    reruns = [v for step, values in by_step.items() if step != 'importar' for v in values]
+    calls = Counter(table.calls)
+    calls.subtract(calls_before)
+
+    return {
+        "sesiones": n_sessions,
+        "ejecuciones": len(reruns),
+        "duracion_s": elapsed,
+        "latencia": percentiles(reruns),
+        "por_paso": {step: percentiles(by_step[step]) for step in STEPS if by_step[step]},
+        "llamadas": dict(+calls),
+        "llamadas_por_ejecucion": sum(calls.values()) / len(reruns) if reruns else 0,
+        "rss_mb": rss_mb(),
+        "errores": [e for s in sessions for e in s.errors],
+    }
+
+
+def _ms(value):
+    return "-" if value is None else f"{value * 1000:.0f}"
+
+
+def print_report(results, detail=False):
+    print(f"{'sesiones':>8} {'ejec':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'llamadas':>9} {'llam/ejec':>9} {'RSS MB':>8} {'errores':>7}")
+    for r in results:
+        lat = r["latencia"]
+        print(f"{r['sesiones']:>8} {r['ejecuciones']:>6} {_ms(lat['p50']):>8} {_ms(lat['p95']):>8} "
+              f"{_ms(lat['p99']):>8} {_ms(lat['max']):>8} {sum(r['llamadas'].values()):>9} "
+              f"{r['llamadas_por_ejecucion']:>9.1f} {r['rss_mb']:>8.0f} {len(r['errores']):>7}")
+        if detail:
+            for step, lat in r["por_paso"].items():
+                print(f"{'':>8} {step:>15} p50 {_ms(lat['p50'])} ms | p95 {_ms(lat['p95'])} ms | "
+                      f"p99 {_ms(lat['p99'])} ms")
+            print(f"{'':>8} llamadas: {r['llamadas']}")
+    for r in results:
+        for error in r["errores"][:5]:
+            log(f"⚠️ {r['sesiones']} sesiones: {error}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Prueba de carga con sesiones simuladas y Supabase en memoria")
+    parser.add_argument("--sesiones", default="1,5,10", help="Niveles de concurrencia separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Veces que cada sesión recorre el guion")
+    parser.add_argument("--filas", type=int, default=1000, help="Registros en la tabla falsa")
+    parser.add_argument("--latencia", type=float, default=0.03, help="Latencia simulada por consulta (segundos)")
+    parser.add_argument("--timeout", type=float, default=120, help="Tiempo máximo por ejecución (segundos)")
+    parser.add_argument("--detalle", action="store_true", help="Muestra latencias por paso y llamadas por tipo")
+    parser.add_argument("--json", help="Guarda los resultados en un archivo JSON")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    levels = [int(n) for n in args.sesiones.split(',') if n.strip()]
+    app_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+    with tempfile.TemporaryDirectory(prefix="loadtest_") as work_dir:
+        table = setup_environment(work_dir, args.filas, args.latencia)
+        import_dir = os.path.join(work_dir, 'importar')
+        os.makedirs(import_dir)
+        log(f"🧪 {args.filas} registros, latencia {args.latencia * 1000:.0f} ms, RSS inicial {rss_mb():.0f} MB")
+
+        results = []
+        for n_sessions in levels:
+            log(f"▶️ {n_sessions} sesiones...")
+            results.append(run_level(n_sessions, args.repeticiones, table, app_path, import_dir, args.timeout))
+
+    print_report(results, detail=args.detalle)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=float)
+    return 1 if any(r["errores"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+import os
+import io
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Perfilar todas las ejecuciones con cProfile (1) o solo bajo demanda (0)
+PROFILE_RERUNS = os.getenv("PROFILE_RERUNS", "0") == "1"
+
+# Segundos a partir de los cuales una ejecución se captura automáticamente (0 = desactivado)
+PROFILE_THRESHOLD_SECONDS = float(os.getenv("PROFILE_THRESHOLD_SECONDS", "0"))
+
+# Directorio donde se guardan las capturas automáticas y de PROFILE_RERUNS
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Clave para mostrar el panel de diagnóstico con ?admin=<clave>
+ADMIN_KEY = os.getenv("ADMIN_KEY", "")
+
+# Intervalo del profiler por muestreo (segundos)
+SAMPLE_INTERVAL = 0.005
+
+# Capturas guardadas en disco
+MAX_SAVED_PROFILES = 50
+
+# Perfil en curso por hilo: una ejecución cortada sin pasar por
+# finish_rerun_profile (st.stop(), excepción) se cierra al empezar la siguiente
+_active = {}
+
+
+class SamplingProfiler:
+    """Profiler por muestreo: un hilo lee la pila del hilo de la ejecución cada
+    SAMPLE_INTERVAL. Su costo es bajo, así que puede quedar activo siempre para
+    capturar las ejecuciones lentas."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.samples = 0
+        self.ended = None  # momento en que terminó el hilo de la ejecución
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                self.ended = time.perf_counter()  # el hilo de la ejecución ya terminó
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def report(self, limit=40):
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for name in set(frames):
+                total[name] += count
+        lines = [f"Muestras: {self.samples} (cada {SAMPLE_INTERVAL * 1000:.0f} ms)", "",
+                 "Tiempo propio (% de muestras):"]
+        lines += [f"  {count / self.samples:6.1%}  {name}" for name, count in own.most_common(limit)]
+        lines += ["", "Tiempo acumulado (% de muestras):"]
+        lines += [f"  {count / self.samples:6.1%}  {name}" for name, count in total.most_common(limit)]
+        lines += ["", "Pilas colapsadas (formato flamegraph):"]
+        lines += [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) if self.samples else "Sin muestras"
+
+
+class RerunProfile:
+    """Perfil de una ejecución del script de Streamlit"""
+
+    def __init__(self, deterministic, sampling):
+        self.started = time.perf_counter()
+        self.finished = False
+        self.deterministic = cProfile.Profile() if deterministic else None
+        self.sampler = SamplingProfiler(threading.get_ident()) if sampling else None
+        if self.sampler:
+            self.sampler.start()
+        if self.deterministic:
+            self.deterministic.enable()
+
+    def stop(self):
+        if self.deterministic:
+            self.deterministic.disable()
+        if self.sampler:
+            self.sampler.stop()
+            if self.sampler.ended:
+                return self.sampler.ended - self.started
+        return time.perf_counter() - self.started
+
+    def stats_text(self, limit=40):
+        if self.deterministic:
+            out = io.StringIO()
+            pstats.Stats(self.deterministic, stream=out).sort_stats('cumulative').print_stats(limit)
+            return out.getvalue()
+        return self.sampler.report(limit) if self.sampler else ""
+
+
+def start_rerun_profile(enabled=False):
+    """Empieza a perfilar la ejecución actual.
+
+    enabled (o PROFILE_RERUNS) usa cProfile; si no, y hay umbral configurado,
+    se usa el profiler por muestreo para poder capturar ejecuciones lentas.
+    Un perfil anterior del mismo hilo que quedó abierto pasa por el mismo
+    umbral y se guarda si fue lento. Regresa None si no hay nada que perfilar.
+    """
+    deterministic = enabled or PROFILE_RERUNS
+    sampling = not deterministic and PROFILE_THRESHOLD_SECONDS > 0
+    stale = _active.get(threading.get_ident())
+    if stale:
+        finish_rerun_profile(stale, {"interrumpida": True})
+    if not deterministic and not sampling:
+        return None
+    profile = RerunProfile(deterministic, sampling)
+    _active[threading.get_ident()] = profile
+    return profile
+
+
+def finish_rerun_profile(profile, state, forced=False):
+    """Termina el perfil y, si se pidió o la ejecución superó el umbral, arma el reporte.
+
+    state es un dict con el estado de los widgets (filtros, búsqueda, vista,
+    conteos) o una función que lo regresa; la función solo se llama si hay
+    reporte. Las capturas que no pidió la sesión (PROFILE_RERUNS o umbral) se
+    guardan en PROFILE_DIR. Se llama al final del script y antes de cada
+    st.rerun(); un perfil ya cerrado regresa None. Regresa el reporte (dict)
+    o None.
+    """
+    if profile is None or profile.finished:
+        return None
+    profile.finished = True
+    if _active.get(threading.get_ident()) is profile:
+        del _active[threading.get_ident()]
+    duration = profile.stop()
+    slow = PROFILE_THRESHOLD_SECONDS > 0 and duration >= PROFILE_THRESHOLD_SECONDS
+    if not (forced or PROFILE_RERUNS or slow):
+        return None
+
+    if callable(state):
+        state = state()
+    captured_at = datetime.now()
+    header = {
+        "fecha": captured_at.isoformat(),
+        "duracion_s": round(duration, 3),
+        "motivo": "manual" if forced or PROFILE_RERUNS else f"umbral {PROFILE_THRESHOLD_SECONDS}s",
+        "profiler": "cProfile" if profile.deterministic else "muestreo",
+        "estado": state,
+    }
+    text = "\n".join([
+        "# Perfil de ejecución - Sistema eSIM BAITEL",
+        json.dumps(header, indent=2, ensure_ascii=False, default=str),
+        "",
+        profile.stats_text(),
+    ])
+    report = {"nombre": f"perfil_{captured_at.strftime('%Y%m%d_%H%M%S_%f')}.txt", "texto": text, **header}
+
+    if not forced:
+        _save(report)
+    return report
+
+
+def _save(report):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, report["nombre"]), "w", encoding="utf-8") as f:
+        f.write(report["texto"])
+    saved = sorted(name for name in os.listdir(PROFILE_DIR) if name.startswith("perfil_"))
+    for name in saved[:-MAX_SAVED_PROFILES]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def saved_profiles():
+    """Capturas automáticas guardadas, de la más reciente a la más antigua"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    return sorted((name for name in os.listdir(PROFILE_DIR) if name.startswith("perfil_")), reverse=True)
+
+
+def read_saved_profile(name):
+    with open(os.path.join(PROFILE_DIR, os.path.basename(name)), encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,237 @@
+import os
+import io
+import csv
+import time
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# URL base del repositorio de QR
+QR_BASE_URL = "https://raw.githubusercontent.com/Kratoslar69/esim-qr-baitel/main/"
+
+# Caché local de imágenes QR (compartida por todas las sesiones del host)
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", ".qr_cache")
+
+# Conexiones simultáneas al repositorio de QR
+QR_MAX_WORKERS = int(os.getenv("QR_MAX_WORKERS", "8"))
+
+QR_TIMEOUT = 10
+
+# Base de datos de la auditoría de QR (estado, fecha de revisión y ETag por ICCID)
+QR_AUDIT_DB = os.getenv("QR_AUDIT_DB", os.path.join(QR_CACHE_DIR, "auditoria.sqlite"))
+
+# Máximo de peticiones HEAD por segundo durante la auditoría
+QR_AUDIT_RATE = float(os.getenv("QR_AUDIT_RATE", "20"))
+
+# Horas tras las cuales un resultado de la auditoría se vuelve a revisar
+QR_AUDIT_MAX_AGE_HOURS = 24
+
+# eSIMs máximas por ZIP armado desde la app; los lotes mayores van por cli.py zip-qr
+QR_ZIP_MAX = int(os.getenv("QR_ZIP_MAX", "500"))
+
+# Revisiones máximas por clic en la app (~25 s a 20/s); el barrido completo va por cli.py auditar-qr
+QR_AUDIT_SWEEP = int(os.getenv("QR_AUDIT_SWEEP", "500"))
+
+MANIFEST_COLUMNS = ['iccid', 'msisdn', 'pin', 'puk']
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Sesión HTTP con pool de conexiones keep-alive, acotado a QR_MAX_WORKERS"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=QR_MAX_WORKERS, max_retries=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def qr_url(iccid):
+    return f"{QR_BASE_URL}{iccid}.png"
+
+
+def check_qr_exists(iccid, etag=None):
+    """Revisa con HEAD si existe el QR. Regresa (código HTTP, ETag).
+
+    Si se pasa el ETag de una revisión anterior se manda If-None-Match; un 304
+    significa que el QR sigue existiendo sin cambios. Error de red -> (0, None).
+    """
+    headers = {"If-None-Match": etag} if etag else {}
+    try:
+        response = get_session().head(qr_url(iccid), headers=headers, timeout=QR_TIMEOUT)
+    except requests.RequestException:
+        return 0, None
+    if response.status_code == 304:
+        return 200, etag
+    return response.status_code, response.headers.get("ETag")
+
+
+def _cache_path(iccid):
+    return os.path.join(QR_CACHE_DIR, f"{iccid}.png")
+
+
+def fetch_qr(iccid):
+    """Regresa los bytes del PNG del QR (desde caché local o descargándolo) o None"""
+    path = _cache_path(iccid)
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        pass
+
+    try:
+        response = get_session().get(qr_url(iccid), timeout=QR_TIMEOUT)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+
+    os.makedirs(QR_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=QR_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(response.content)
+    os.replace(tmp_path, path)
+    return response.content
+
+
+def build_qr_zip(records, progress=None):
+    """Arma un ZIP con los QR de los registros dados y un manifest.csv.
+
+    Las imágenes se descargan en paralelo con a lo más QR_MAX_WORKERS
+    conexiones y se escriben al ZIP conforme llegan, con una ventana acotada de
+    descargas en vuelo, así que nunca se tienen todas en memoria. El ZIP se
+    escribe en un archivo temporal en disco.
+
+    records es una lista de dicts con iccid, msisdn, pin y puk. Regresa
+    (archivo temporal posicionado al inicio, lista de ICCID sin QR).
+    """
+    output = tempfile.TemporaryFile()
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(MANIFEST_COLUMNS + ['qr'])
+    missing = []
+    window = QR_MAX_WORKERS * 2
+
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_STORED) as zf, \
+            ThreadPoolExecutor(max_workers=QR_MAX_WORKERS) as executor:
+        for start in range(0, len(records), window):
+            batch = records[start:start + window]
+            futures = [executor.submit(fetch_qr, r['iccid']) for r in batch]
+            for record, future in zip(batch, futures):
+                content = future.result()
+                if content is None:
+                    missing.append(record['iccid'])
+                else:
+                    # PNG ya viene comprimido: se guarda sin recomprimir
+                    zf.writestr(f"{record['iccid']}.png", content)
+                writer.writerow([record.get(c) or '' for c in MANIFEST_COLUMNS] + ['ok' if content else 'faltante'])
+            if progress:
+                progress(min(start + window, len(records)) / len(records))
+
+        zf.writestr("manifest.csv", manifest.getvalue().encode('utf-8-sig'), compress_type=zipfile.ZIP_DEFLATED)
+
+    output.seek(0)
+    return output, missing
+
+
+class _RateLimiter:
+    """Limita las peticiones por segundo entre todos los hilos"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+@contextmanager
+def _audit_connection():
+    """Conexión SQLite a la caché de auditoría; confirma y cierra al salir"""
+    os.makedirs(os.path.dirname(QR_AUDIT_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(QR_AUDIT_DB, timeout=30)
+    try:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS qr_audit ("
+            "iccid TEXT PRIMARY KEY, status INTEGER, checked_at TEXT, etag TEXT)"
+        )
+        yield conn
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def load_qr_audit():
+    """Resultados guardados de la auditoría: iccid, status, checked_at, etag"""
+    with _audit_connection() as conn:
+        return pd.read_sql_query("SELECT iccid, status, checked_at, etag FROM qr_audit", conn)
+
+
+def missing_qr_iccids():
+    """ICCIDs cuya última revisión dio 404 (QR no subido)"""
+    with _audit_connection() as conn:
+        return {row[0] for row in conn.execute("SELECT iccid FROM qr_audit WHERE status = 404")}
+
+
+def run_qr_audit(iccids, max_age_hours=QR_AUDIT_MAX_AGE_HOURS, progress=None, limit=None):
+    """Revisa la existencia del QR de cada ICCID con HEAD concurrentes.
+
+    Solo se revisan los ICCID sin resultado, con resultado más viejo que
+    max_age_hours o cuya revisión anterior falló; el resto se toma de la caché.
+    Con limit se revisan como máximo limit ICCID, primero los nunca revisados
+    y después los más antiguos (barridos incrementales). Las peticiones usan
+    la sesión con pool y se limitan a QR_AUDIT_RATE por segundo. Regresa el
+    número de ICCID revisados en esta corrida.
+    """
+    cutoff = (datetime.now() - timedelta(hours=max_age_hours)).isoformat()
+    with _audit_connection() as conn:
+        cached = {
+            row[0]: row[1:]
+            for row in conn.execute("SELECT iccid, status, checked_at, etag FROM qr_audit")
+        }
+    pending = []
+    for iccid in dict.fromkeys(iccids):
+        status, checked_at, etag = cached.get(iccid, (None, None, None))
+        if status in (200, 404) and checked_at >= cutoff:
+            continue
+        pending.append((iccid, etag if status == 200 else None))
+    if limit is not None and len(pending) > limit:
+        pending = sorted(pending, key=lambda item: cached.get(item[0], (None, ''))[1] or '')[:limit]
+    if not pending:
+        return 0
+
+    limiter = _RateLimiter(QR_AUDIT_RATE)
+
+    def check(item):
+        limiter.wait()
+        status, etag = check_qr_exists(*item)
+        return item[0], status, datetime.now().isoformat(), etag
+
+    window = QR_MAX_WORKERS * 32
+    with ThreadPoolExecutor(max_workers=QR_MAX_WORKERS) as executor:
+        for start in range(0, len(pending), window):
+            results = list(executor.map(check, pending[start:start + window]))
+            with _audit_connection() as conn:
+                conn.executemany("INSERT OR REPLACE INTO qr_audit VALUES (?, ?, ?, ?)", results)
+            if progress:
+                progress(min(start + window, len(pending)) / len(pending))
+    return len(pending)
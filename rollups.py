@@ -0,0 +1,121 @@
+import threading
+from collections import Counter
+
+import pandas as pd
+
+from snapshot_store import as_text, overlap_watermark
+
+
+def _day(series):
+    """Fecha (sin hora) a partir de textos 'YYYY-MM-DD...' de formatos mezclados"""
+    return pd.to_datetime(as_text(series).str.strip().str.slice(0, 10), format='%Y-%m-%d', errors='coerce')
+
+
+def _column(df, name):
+    return as_text(df[name]).str.strip() if name in df.columns else pd.Series('', index=df.index)
+
+
+def _contributions(df):
+    """Aportación por id: día de asignación (solo si sigue asignada), día de alta y grupos"""
+    asignado = _column(df, 'asignado_a')
+    contrib = pd.DataFrame({
+        'dia_asignacion': _day(_column(df, 'fecha_asignacion')).where(asignado != ''),
+        'dia_alta': _day(_column(df, 'fecha_creacion')),
+        'distribuidor': _column(df, 'distribuidor'),
+        'asignado_a': asignado,
+        'ip': _column(df, 'ip'),
+    })
+    contrib.index = pd.Index(df['id'].astype(object).to_numpy(), name='id')
+    return contrib
+
+
+class AssignmentRollups:
+    """Agregados diarios de asignaciones y de stock por IP.
+
+    Los contadores se construyen una vez y después se actualizan solo con las
+    filas que cambiaron entre versiones de datos (fecha_ultimo_cambio dentro de
+    la ventana SYNC_OVERLAP_MINUTES antes de la última vista, ids que no se
+    habían visto o ids eliminados): se resta la aportación anterior de cada
+    fila y se suma la nueva, así que releer una fila sin cambios no altera los
+    agregados. Las gráficas leen de los
+    agregados, cuyo tamaño depende de días x grupos y no del inventario.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.watermark = ''
+        self.max_id = 0
+        self.contrib = None
+        self.asignaciones = Counter()  # (día, distribuidor, asignado_a) -> eSIMs asignadas
+        self.altas_ip = Counter()      # (día, ip) -> eSIMs dadas de alta
+        self.asignadas_ip = Counter()  # (día, ip) -> eSIMs asignadas
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def _apply(self, contrib, sign):
+        asig = contrib.dropna(subset=['dia_asignacion'])
+        for key, n in asig.groupby(['dia_asignacion', 'distribuidor', 'asignado_a']).size().items():
+            self.asignaciones[key] += sign * n
+        for key, n in asig.groupby(['dia_asignacion', 'ip']).size().items():
+            self.asignadas_ip[key] += sign * n
+        altas = contrib.dropna(subset=['dia_alta'])
+        for key, n in altas.groupby(['dia_alta', 'ip']).size().items():
+            self.altas_ip[key] += sign * n
+
+    def update(self, df, version):
+        """Pone los agregados al día con la versión de datos dada"""
+        with self._lock:
+            if version == self.version or df.empty:
+                return
+            cambio = _column(df, 'fecha_ultimo_cambio')
+
+            if self.contrib is None:
+                self.contrib = _contributions(df)
+                self._apply(self.contrib, 1)
+            else:
+                ids = df['id'].astype(object)
+                # Ventana de traslape: escrituras confirmadas tarde traen una fecha anterior a la marca
+                changed = ((cambio >= overlap_watermark(self.watermark)) | (ids > self.max_id)
+                           | ~ids.isin(self.contrib.index)).to_numpy(dtype=bool)
+                new_contrib = _contributions(df[changed])
+                deleted = self.contrib.index.difference(pd.Index(ids.to_numpy()))
+                stale = self.contrib.index.intersection(new_contrib.index).union(deleted)
+
+                self._apply(self.contrib.loc[stale], -1)
+                self._apply(new_contrib, 1)
+                self.contrib = pd.concat([self.contrib.drop(stale), new_contrib])
+
+            self.watermark = max(self.watermark, cambio.max() or '')
+            self.max_id = max(self.max_id, int(df['id'].max()))
+            self.version = version
+            self._results = {}
+
+    def assignments(self, freq='D', by='distribuidor'):
+        """Asignaciones por periodo ('D' día, 'W' semana) y grupo (distribuidor o asignado_a)"""
+        key = ('asignaciones', freq, by)
+        if key not in self._results:
+            rows = [(dia, dist if by == 'distribuidor' else asig, n)
+                    for (dia, dist, asig), n in self.asignaciones.items() if n]
+            frame = pd.DataFrame(rows, columns=['fecha', by, 'asignaciones'])
+            if freq != 'D' and not frame.empty:
+                frame['fecha'] = frame['fecha'].dt.to_period(freq).dt.start_time
+            self._results[key] = (frame.groupby(['fecha', by], as_index=False)['asignaciones'].sum()
+                                  .sort_values('fecha'))
+        return self._results[key]
+
+    def stock_burndown(self, top=10):
+        """Stock disponible acumulado por día para las IPs con más eSIMs"""
+        key = ('burndown', top)
+        if key not in self._results:
+            altas = pd.Series(self.altas_ip, dtype='int64')
+            asignadas = pd.Series(self.asignadas_ip, dtype='int64')
+            movimiento = altas.sub(asignadas, fill_value=0)
+            if movimiento.empty:
+                self._results[key] = pd.DataFrame(columns=['fecha', 'ip', 'disponibles'])
+                return self._results[key]
+            diario = movimiento.unstack(level=1, fill_value=0).sort_index()
+            top_ips = altas.groupby(level=1).sum().nlargest(top).index
+            stock = diario[diario.columns.intersection(top_ips)].cumsum()
+            stock.index.name, stock.columns.name = 'fecha', 'ip'
+            self._results[key] = stock.stack().rename('disponibles').reset_index()
+        return self._results[key]
@@ -0,0 +1,65 @@
+import sys
+
+import pandas as pd
+
+# Detalles de eSIM abiertos a la vez por sesión (el más antiguo se cierra)
+MAX_OPEN_DETAILS = 3
+
+OPEN_DETAILS_KEY = 'detalles_abiertos'
+
+# Banderas por fila de versiones anteriores (show_qr_<id>)
+LEGACY_PREFIXES = ('show_qr_',)
+
+
+def open_details(state):
+    """ids con el detalle abierto, del más antiguo al más reciente"""
+    return state.get(OPEN_DETAILS_KEY, [])
+
+
+def is_detail_open(state, esim_id):
+    return esim_id in open_details(state)
+
+
+def open_detail(state, esim_id):
+    opened = [i for i in open_details(state) if i != esim_id] + [esim_id]
+    state[OPEN_DETAILS_KEY] = opened[-MAX_OPEN_DETAILS:]
+
+
+def close_detail(state, esim_id):
+    state[OPEN_DETAILS_KEY] = [i for i in open_details(state) if i != esim_id]
+
+
+def evict_offscreen(state, visible_ids):
+    """Cierra los detalles de filas que ya no están en pantalla y borra banderas viejas.
+
+    visible_ids es la columna id de las filas mostradas. Los controles por
+    fila (asignado_<id>, estado_<id>, ...) solo existen mientras su detalle
+    está abierto, así que Streamlit los descarta al cerrarlo.
+    """
+    for key in [k for k in state.keys() if isinstance(k, str) and k.startswith(LEGACY_PREFIXES)]:
+        del state[key]
+
+    opened = open_details(state)
+    if not opened:
+        return
+    on_screen = set(visible_ids[visible_ids.isin(opened)].tolist())
+    if len(on_screen) < len(opened):
+        state[OPEN_DETAILS_KEY] = [i for i in opened if i in on_screen]
+
+
+def _approx_size(value, depth=0):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, (bytes, bytearray, str)):
+        return sys.getsizeof(value)
+    if depth < 4 and isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_approx_size(k, depth + 1) + _approx_size(v, depth + 1) for k, v in value.items())
+    if depth < 4 and isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(_approx_size(v, depth + 1) for v in value)
+    return sys.getsizeof(value)
+
+
+def session_memory(state):
+    """Memoria aproximada de la sesión: (bytes totales, [(clave, bytes)] de mayor a menor)"""
+    sizes = sorted(((str(key), _approx_size(state[key])) for key in list(state.keys())), key=lambda item: -item[1])
+    return sum(size for _, size in sizes), sizes
@@ -0,0 +1,274 @@
+import os
+import json
+import glob
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow as pa
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+# Directorio del snapshot compartido por todos los workers del mismo host
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", ".snapshot")
+
+# Tamaño de página para la descarga completa (PostgREST limita filas por respuesta)
+PAGE_SIZE = 1000
+
+# Cuántas versiones anteriores se conservan en disco
+KEEP_VERSIONS = 2
+
+# Minutos que se vuelven a leer detrás de la marca de agua: fecha_ultimo_cambio
+# la pone la app al enviar la escritura, no la base al confirmarla, así que una
+# escritura lenta puede confirmarse con una fecha anterior a la marca ya guardada
+SYNC_OVERLAP_MINUTES = float(os.getenv("SYNC_OVERLAP_MINUTES", "5"))
+
+META_FILE = "meta.json"
+LOCK_FILE = ".lock"
+
+
+def _snapshot_path(directory, version):
+    return os.path.join(directory, f"inventario_v{version:08d}.arrow")
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, META_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _writer_lock(directory):
+    """Bloqueo exclusivo para que un solo worker reescriba el snapshot a la vez"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), "w") as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def as_text(series):
+    """Serie como texto, con '' en lugar de nulos (pd.NA, None, NaN)"""
+    return series.astype(object).where(series.notna(), '').astype(str)
+
+
+def to_arrow_table(df):
+    """Convierte el DataFrame a Arrow; columnas con tipos mezclados se guardan como texto"""
+    arrays = []
+    for col in df.columns:
+        try:
+            arrays.append(pa.array(df[col], from_pandas=True))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            values = df[col].where(df[col].notna(), None)
+            arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+    return pa.Table.from_arrays(arrays, names=[str(c) for c in df.columns])
+
+
+def load_snapshot(directory=SNAPSHOT_DIR):
+    """Abre la última versión del snapshot con memory-map.
+
+    Regresa (tabla, meta) o (None, None) si no hay snapshot. Los buffers de la
+    tabla apuntan al archivo mapeado, así que todos los procesos que lo abren
+    comparten las mismas páginas del page cache.
+    """
+    meta = _read_meta(directory)
+    if not meta:
+        return None, None
+    try:
+        source = pa.memory_map(_snapshot_path(directory, meta["version"]), "r")
+        table = pa.ipc.open_file(source).read_all()
+        return table, meta
+    except (OSError, pa.ArrowInvalid, KeyError):
+        return None, None
+
+
+def write_snapshot(df, directory=SNAPSHOT_DIR, watermark=None, columns="*"):
+    """Escribe una nueva versión del snapshot de forma atómica y regresa su meta"""
+    os.makedirs(directory, exist_ok=True)
+    meta = _read_meta(directory) or {"version": 0}
+    version = meta["version"] + 1
+    table = to_arrow_table(df)
+
+    # Formato IPC sin compresión para poder mapearlo directamente
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, _snapshot_path(directory, version))
+
+    new_meta = {"version": version, "watermark": watermark, "rows": table.num_rows, "columns": columns}
+    fd, tmp_meta = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(new_meta, f)
+    os.replace(tmp_meta, os.path.join(directory, META_FILE))
+
+    # Borrar versiones viejas; los procesos que aún las tengan mapeadas no se ven afectados
+    old_files = sorted(glob.glob(os.path.join(directory, "inventario_v*.arrow")))
+    for path in old_files[:-KEEP_VERSIONS]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    return new_meta
+
+
+def snapshot_to_frame(table):
+    """DataFrame respaldado por Arrow (sin copiar los buffers mapeados)"""
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def run_queries(client, queries):
+    """Ejecuta consultas independientes; en paralelo si el cliente lo soporta (DataLayer)"""
+    if hasattr(client, "gather"):
+        return client.gather(*queries)
+    return [query.execute() for query in queries]
+
+
+def fetch_many(client, table_name, requests):
+    """Descarga paginada de varias consultas independientes a la vez.
+
+    requests es una lista de (columnas, filtro) donde filtro recibe el
+    constructor de la consulta y regresa el constructor filtrado (o None).
+    Cada ronda pide en paralelo la siguiente página de las consultas que aún
+    tienen datos. Regresa una lista de filas por consulta, ordenadas por id.
+    """
+    results = [[] for _ in requests]
+    pending = list(range(len(requests)))
+    start = 0
+    while pending:
+        queries = []
+        for i in pending:
+            columns, query = requests[i]
+            request = client.table(table_name).select(columns)
+            if query:
+                request = query(request)
+            queries.append(request.order('id').range(start, start + PAGE_SIZE - 1))
+        still_pending = []
+        for i, response in zip(pending, run_queries(client, queries)):
+            page = response.data or []
+            results[i].extend(page)
+            if len(page) == PAGE_SIZE:
+                still_pending.append(i)
+        pending = still_pending
+        start += PAGE_SIZE
+    return results
+
+
+def fetch_all(client, table_name, columns="*", query=None):
+    """Descarga paginada de la tabla completa (o de un filtro) ordenada por id"""
+    return fetch_many(client, table_name, [(columns, query)])[0]
+
+
+def fetch_by_ids(client, ids, table_name='esim_data', columns="*"):
+    """Registros completos de una lista de ids, en lotes de PAGE_SIZE pedidos en paralelo"""
+    ids = list(ids)
+    queries = [
+        client.table(table_name).select(columns).in_('id', ids[start:start + PAGE_SIZE])
+        for start in range(0, len(ids), PAGE_SIZE)
+    ]
+    return [row for response in run_queries(client, queries) for row in (response.data or [])]
+
+
+def overlap_watermark(watermark, minutes=SYNC_OVERLAP_MINUTES):
+    """Marca de agua recorrida hacia atrás la ventana de seguridad (mismo formato ISO)"""
+    try:
+        return (datetime.fromisoformat(watermark) - timedelta(minutes=minutes)).isoformat()
+    except (TypeError, ValueError):
+        return watermark
+
+
+def _same_row(row, stored):
+    return all(
+        (None if row.get(col) is None else str(row.get(col))) == (None if stored.get(col) is None else str(stored.get(col)))
+        for col in row
+    )
+
+
+def _watermark(df):
+    if df.empty or 'fecha_ultimo_cambio' not in df.columns:
+        return None
+    values = df['fecha_ultimo_cambio'].dropna()
+    return str(values.astype(str).max()) if not values.empty else None
+
+
+def sync_snapshot(client, table_name='esim_data', directory=SNAPSHOT_DIR, force_full=False, columns="*"):
+    """Pone al día el snapshot en disco y regresa (DataFrame, versión).
+
+    En arranque en frío (o con force_full) descarga la tabla completa. Si ya hay
+    snapshot solo pide las filas con fecha_ultimo_cambio dentro de la ventana
+    SYNC_OVERLAP_MINUTES antes de la marca guardada o con id mayor al último
+    conocido (altas sin fecha), más la lista de ids para detectar registros
+    borrados. Los ids vivos que faltan en el snapshot (altas confirmadas tarde,
+    con id o fecha por debajo de lo ya sincronizado) se piden aparte. Si no
+    hubo cambios se reutiliza el archivo mapeado tal cual.
+
+    columns limita las columnas que se descargan y guardan (proyección); si
+    cambia respecto al snapshot guardado se hace una descarga completa.
+    """
+    table, meta = load_snapshot(directory)
+    same_columns = meta is not None and meta.get("columns", "*") == columns
+
+    if table is not None and meta.get("watermark") and same_columns and not force_full:
+        watermark = meta["watermark"]
+        current = snapshot_to_frame(table)
+        max_id = int(current['id'].max()) if len(current) else 0
+        # Cambios, altas e ids vivos son independientes: se piden en paralelo
+        since = overlap_watermark(watermark)
+        recent, added, ids = fetch_many(client, table_name, [
+            (columns, lambda q: q.gte('fecha_ultimo_cambio', since)),
+            (columns, lambda q: q.gt('id', max_id)),
+            ('id', None),
+        ])
+        live_ids = {row['id'] for row in ids}
+        deleted = len(current) - int(current['id'].isin(live_ids).sum())
+
+        # La ventana vuelve a traer filas ya sincronizadas: solo cuentan las que cambiaron
+        stored = {}
+        if recent:
+            window = current[current['id'].isin([row['id'] for row in recent]).fillna(False).to_numpy(dtype=bool)]
+            stored = {row['id']: row for row in window.astype(object).where(window.notna(), None).to_dict('records')}
+        changed = [row for row in recent if row['id'] not in stored or not _same_row(row, stored[row['id']])]
+        changed += added
+
+        known = set(current['id'].tolist()) | {row['id'] for row in changed}
+        missing = sorted(live_ids - known)
+        if missing:
+            changed += fetch_by_ids(client, missing, table_name, columns)
+
+        if not changed and not deleted:
+            return current, meta["version"]
+
+        with _writer_lock(directory):
+            # Otro worker pudo haber escrito mientras esperábamos el bloqueo
+            latest = _read_meta(directory)
+            if latest and latest["version"] != meta["version"]:
+                table, meta = load_snapshot(directory)
+                current = snapshot_to_frame(table)
+
+            base = current.astype(object).where(current.notna(), None)
+            base = base[base['id'].isin(live_ids)]
+            if changed:
+                delta = pd.DataFrame(changed).drop_duplicates('id', keep='last')
+                base = pd.concat([base[~base['id'].isin(delta['id'])], delta], ignore_index=True)
+            base = base.sort_values('id', ascending=False, ignore_index=True)
+            meta = write_snapshot(base, directory, watermark=_watermark(base) or watermark, columns=columns)
+    else:
+        with _writer_lock(directory):
+            full = pd.DataFrame(fetch_all(client, table_name, columns=columns))
+            if full.empty:
+                return full, 0
+            full = full.sort_values('id', ascending=False, ignore_index=True)
+            meta = write_snapshot(full, directory, watermark=_watermark(full), columns=columns)
+
+    table, meta = load_snapshot(directory)
+    return snapshot_to_frame(table), meta["version"]
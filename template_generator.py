@@ -1,8 +1,168 @@
-import pandas as pd
 import io
+import re
+import zipfile
+import functools
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+from openpyxl.utils import get_column_letter
+
+EXCEL_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Ancho máximo de columna en los reportes (caracteres)
+MAX_COLUMN_WIDTH = 60
+
+# Filas que se convierten a XML por bloque al escribir un reporte
+REPORT_CHUNK_ROWS = 20000
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Fuente normal (estilo 0) y negrita para encabezados (estilo 1)
+_STYLES = (
+    f'{_XML_HEADER}<styleSheet xmlns="{_MAIN_NS}">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+# Caracteres de control que XML no permite
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def column_widths(df):
+    """Ancho de cada columna: el texto más largo (encabezado incluido) + 2"""
+    widths = []
+    for column in df.columns:
+        longest = df[column].astype('string').str.len().max() if len(df) else 0
+        longest = 0 if pd.isna(longest) else int(longest)
+        widths.append(min(max(longest, len(str(column))) + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def _is_numeric(series):
+    if pd.api.types.is_bool_dtype(series):
+        return False
+    if pd.api.types.is_numeric_dtype(series):
+        return True
+    return series.dtype == object and pd.api.types.infer_dtype(series, skipna=True) in ('integer', 'floating', 'mixed-integer-float')
+
+
+def _cells_xml(series, refs):
+    """XML de las celdas de una columna, calculado para toda la columna a la vez.
 
-def generate_template():
-    """Genera una plantilla Excel con el formato correcto para importar eSIMs"""
+    refs son las referencias de celda (A2, A3, ...); las celdas vacías se omiten.
+    """
+    if _is_numeric(series):
+        numbers = pd.to_numeric(series, errors='coerce').astype('float64')
+        valid = np.isfinite(numbers.to_numpy())
+        text = series.astype(object).astype(str).to_numpy(dtype=object)
+        return np.where(valid, '<c r="' + refs + '"><v>' + text + '</v></c>', '')
+
+    valid = series.notna().to_numpy()
+    text = series.astype(object).where(valid, '').astype(str)
+    text = text.str.replace(_INVALID_XML, '', regex=True)
+    text = text.str.replace('&', '&amp;', regex=False).str.replace('<', '&lt;', regex=False).str.replace('>', '&gt;', regex=False)
+    return np.where(
+        valid,
+        '<c r="' + refs + '" t="inlineStr"><is><t xml:space="preserve">' + text.to_numpy(dtype=object) + '</t></is></c>',
+        ''
+    )
+
+
+def _write_sheet(stream, df):
+    stream.write(f'{_XML_HEADER}<worksheet xmlns="{_MAIN_NS}"><cols>'.encode())
+    for index, width in enumerate(column_widths(df), start=1):
+        stream.write(f'<col min="{index}" max="{index}" width="{width}" customWidth="1"/>'.encode())
+    stream.write(b'</cols><sheetData><row r="1">')
+    letters = [get_column_letter(index) for index in range(1, len(df.columns) + 1)]
+    for letter, column in zip(letters, df.columns):
+        header = escape(_INVALID_XML.sub('', str(column)))
+        stream.write(f'<c r="{letter}1" s="1" t="inlineStr"><is><t>{header}</t></is></c>'.encode('utf-8'))
+    stream.write(b'</row>')
+
+    for start in range(0, len(df), REPORT_CHUNK_ROWS):
+        chunk = df.iloc[start:start + REPORT_CHUNK_ROWS]
+        numbers = np.arange(start + 2, start + 2 + len(chunk)).astype(str).astype(object)
+        rows = '<row r="' + numbers + '">'
+        for letter, column in zip(letters, chunk.columns):
+            rows = rows + _cells_xml(chunk[column], letter + numbers)
+        stream.write(('</row>'.join(rows) + '</row>').encode('utf-8'))
+    stream.write(b'</sheetData></worksheet>')
+
+
+def write_report(sheets, target=None):
+    """Escribe un .xlsx con una hoja por DataFrame.
+
+    sheets es un dict nombre de hoja -> DataFrame. El XML de cada hoja se arma
+    por columnas con operaciones vectorizadas y se escribe por bloques
+    directo al zip, sin crear un objeto por celda, así que un reporte de 100k
+    filas tarda una fracción de lo que tarda openpyxl. Los números van como
+    números y todo lo demás como texto; el encabezado va en negritas. Sin
+    target regresa los bytes del archivo; con target (ruta o buffer) lo
+    guarda ahí.
+    """
+    output = io.BytesIO() if target is None else target
+    names = list(sheets)
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(names) + 1)
+        )
+        archive.writestr('[Content_Types].xml', (
+            f'{_XML_HEADER}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{overrides}</Types>'
+        ))
+        archive.writestr('_rels/.rels', (
+            f'{_XML_HEADER}<Relationships xmlns="{_PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr('xl/workbook.xml', (
+            f'{_XML_HEADER}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>'
+            + ''.join(
+                f'<sheet name="{escape(name[:31], {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, name in enumerate(names, start=1)
+            )
+            + '</sheets></workbook>'
+        ))
+        archive.writestr('xl/_rels/workbook.xml.rels', (
+            f'{_XML_HEADER}<Relationships xmlns="{_PKG_REL_NS}">'
+            + ''.join(
+                f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, len(names) + 1)
+            )
+            + f'<Relationship Id="rId{len(names) + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr('xl/styles.xml', _STYLES)
+        for i, name in enumerate(names, start=1):
+            with archive.open(f'xl/worksheets/sheet{i}.xml', 'w', force_zip64=True) as stream:
+                _write_sheet(stream, sheets[name])
+
+    return output.getvalue() if target is None else target
+
+
+@functools.lru_cache(maxsize=1)
+def template_bytes():
+    """Plantilla Excel para importar eSIMs, generada una sola vez por proceso"""
     
     # Datos de ejemplo - TODOS los campos que existen en Supabase
     data = {
@@ -23,35 +183,10 @@ def generate_template():
         'fecha_asignacion': ['', '']  # Vacío - se llena automáticamente al asignar
     }
     
-    df = pd.DataFrame(data)
-    
-    # Crear archivo Excel en memoria
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='eSIM Template')
-        
-        # Obtener el workbook y worksheet
-        workbook = writer.book
-        worksheet = writer.sheets['eSIM Template']
-        
-        # Ajustar ancho de columnas
-        for column in worksheet.columns:
-            max_length = 0
-            column = [cell for cell in column]
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(cell.value)
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet.column_dimensions[column[0].column_letter].width = adjusted_width
-    
-    output.seek(0)
-    return output
+    return write_report({'eSIM Template': pd.DataFrame(data)})
 
 def validate_import_data(df):
-    """Valida que los datos importados tengan el formato correcto"""
+    """Valida que los datos importados (ya normalizados) tengan el formato correcto"""
     
     # Campos obligatorios (sin los auto-generados por Supabase)
     required_columns = ['iccid', 'msisdn', 'imsi', 'pin', 'puk', 'serie', 'producto', 'estado']
@@ -74,6 +209,13 @@ def validate_import_data(df):
     if df['msisdn'].isna().any() or (df['msisdn'] == '').any():
         return False, "❌ Hay MSISDNs vacíos en el archivo"
     
+    # Verificar la longitud de MSISDN (10 dígitos) e IMSI (15 dígitos)
+    for column, length in [('msisdn', 10), ('imsi', 15)]:
+        values = df[column].dropna()
+        invalid = values[~values.astype(str).str.fullmatch(rf'\d{{{length}}}')]
+        if not invalid.empty:
+            return False, f"❌ {column.upper()} inválidos (deben tener {length} dígitos): {', '.join(invalid.astype(str).tolist()[:5])}"
+    
     # Verificar que los estados sean válidos
     valid_estados = ['Disponible', 'Usado']
     invalid_estados = df[~df['estado'].isin(valid_estados)]
@@ -86,12 +228,5 @@ def validate_import_data(df):
     if not invalid_productos.empty:
         return False, f"❌ Productos inválidos encontrados. Solo se permiten: {', '.join(valid_productos)}"
     
-    # Limpiar campos opcionales que pueden venir vacíos
-    optional_fields = ['asignado_a', 'distribuidor', 'ip', 'fecha_creacion', 'fecha_ultimo_cambio', 'image_index', 'fecha_asignacion']
-    for field in optional_fields:
-        if field in df.columns:
-            # Reemplazar vacíos por None para que Supabase los maneje correctamente
-            df[field] = df[field].replace('', None)
-            df[field] = df[field].replace('nan', None)
-    
+    # Los vacíos ya llegan como None desde import_engine.normalize_import
     return True, f"✅ Datos válidos ({len(df)} registros)"